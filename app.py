@@ -2,14 +2,18 @@
 # PROJECT: Fuzzy Investment Advisor - Remove Green Box
 # FILE: app.py
 # AUTHOR: (Your Name) / Gemini AI
-# REQUIRES: pip install streamlit pandas plotly pillow
+# REQUIRES: pip install streamlit pandas plotly
 # -----------------------------------------------------------------
 
+import os
+
 import streamlit as st
-import pandas as pd
-import plotly.express as px
-from fuzzy_investment_engine import FuzzyInvestmentEngine, get_example_recommendations
-from PIL import Image # Import Pillow for image handling
+from fuzzy_investment_engine import (
+    FuzzyInvestmentEngine,
+    get_example_recommendations,
+    portfolio_risk_level,
+)
+# pandas และ plotly ถูก import ในหน้า Output เมื่อต้องวาดกราฟเท่านั้น (ลดเวลา cold start)
 
 # --- กำหนดค่าเริ่มต้นและสไตล์ ---
 st.set_page_config(
@@ -18,10 +22,10 @@ st.set_page_config(
     initial_sidebar_state="collapsed",
 )
 
-# โหลดโลโก้
-try:
-    logo = Image.open("fia_logo.png")
-except FileNotFoundError:
+# โหลดโลโก้ (st.image รับ path ได้โดยตรง ไม่ต้องเปิดไฟล์ด้วย Pillow)
+if os.path.isfile("fia_logo.png"):
+    logo = "fia_logo.png"
+else:
     logo = None
     st.error("ไม่พบไฟล์ 'fia_logo.png' โปรดตรวจสอบไฟล์โลโก้ในโฟลเดอร์เดียวกับ app.py")
 
@@ -252,6 +256,14 @@ st.markdown("""
 """, unsafe_allow_html=True)
 
 
+# --- Engine (สร้างครั้งเดียวต่อ process ใช้ร่วมกันทุก rerun และทุก session) ---
+@st.cache_resource
+def get_engine():
+    # backend 'fused' ไม่มี state ที่เปลี่ยนแปลงระหว่างคำนวณ หลาย session จึงใช้ร่วมกันได้
+    # ไม่เปิด RecommendationCache: ฟอร์มคำนวณผ่าน AdvisorSession ซึ่งไม่เรียก calculate_portfolio
+    return FuzzyInvestmentEngine(backend='fused')
+
+
 # --- กำหนดสถานะของหน้า (เพื่อจำว่าอยู่หน้าไหน) ---
 if 'page' not in st.session_state:
     st.session_state.page = 'home'
@@ -261,6 +273,8 @@ if 'example_recommendations' not in st.session_state:
     st.session_state.example_recommendations = None
 if 'risk_level_text' not in st.session_state:
     st.session_state.risk_level_text = ""
+if 'advisor_session' not in st.session_state:
+    st.session_state.advisor_session = None
 if 'user_age_input' not in st.session_state: st.session_state.user_age_input = 30
 if 'user_income_input' not in st.session_state: st.session_state.user_income_input = 50000
 if 'user_time_horizon_input' not in st.session_state: st.session_state.user_time_horizon_input = 10
@@ -339,8 +353,15 @@ def input_page():
             st.session_state.user_time_horizon_input = time_horizon
             st.session_state.user_risk_tolerance_input = risk_tolerance
 
-            engine = FuzzyInvestmentEngine()
-            portfolio_results = engine.calculate_portfolio(age, income, time_horizon, risk_tolerance)
+            # ใช้ AdvisorSession ต่อผู้ใช้: ปรับฟอร์มทีละช่อง -> คำนวณใหม่เฉพาะส่วนที่เปลี่ยน
+            session = st.session_state.advisor_session
+            if session is None:
+                session = get_engine().session(age, income, time_horizon, risk_tolerance)
+                st.session_state.advisor_session = session
+                portfolio_results = dict(session.result)
+            else:
+                portfolio_results = session.update(age=age, income=income, time_horizon=time_horizon,
+                                                   risk_tolerance=risk_tolerance)
             
             if portfolio_results:
                 example_recommendations = get_example_recommendations(
@@ -349,12 +370,8 @@ def input_page():
                     portfolio_results['cash']
                 )
 
-                if portfolio_results['equity'] > 70:
-                    risk_level_text = "สูง"
-                elif portfolio_results['equity'] > 40:
-                    risk_level_text = "ปานกลาง"
-                else:
-                    risk_level_text = "ต่ำ"
+                # เกณฑ์เดียวกับประเภทพอร์ตใน get_example_recommendations (PORTFOLIO_TYPE_THRESHOLDS)
+                risk_level_text = portfolio_risk_level(portfolio_results['equity'])
 
                 st.session_state.portfolio_results = portfolio_results
                 st.session_state.example_recommendations = example_recommendations
@@ -364,6 +381,9 @@ def input_page():
 
 # --- หน้า Output (Layout ใหม่) ---
 def output_page():
+    import pandas as pd
+    import plotly.express as px
+
     # --- ใช้ Header แบบใหม่ที่ปรับแล้ว ---
     st.markdown(f"""
         <div class="fia-header-container">
@@ -434,6 +454,47 @@ def output_page():
 
         st.markdown('</div>', unsafe_allow_html=True)
 
+    # --- What-if: สัดส่วนพอร์ตเมื่อปรับ Input ทีละตัว (คำนวณทั้งเส้น/ทั้ง grid ใน batch เดียว) ---
+    st.markdown("<h3>ถ้าข้อมูลเปลี่ยนไป สัดส่วนพอร์ตจะเป็นอย่างไร</h3>", unsafe_allow_html=True)
+    engine = get_engine()
+    current = {
+        'age': st.session_state.user_age_input,
+        'income': st.session_state.user_income_input,
+        'time_horizon': st.session_state.user_time_horizon_input,
+        'risk_tolerance': st.session_state.user_risk_tolerance_input,
+    }
+    asset_labels = {'equity': 'หุ้น', 'bonds': 'พันธบัตร', 'cash': 'เงินฝาก'}
+    axis_labels = {'age': 'อายุ', 'time_horizon': 'ระยะเวลาการลงทุน (ปี)'}
+
+    col_curve, col_heatmap = st.columns(2)
+    with col_curve:
+        axis = st.radio("ปรับค่า", list(axis_labels), format_func=axis_labels.get, horizontal=True)
+        curve = engine.sweep({axis: 200}, current)
+        df_curve = pd.DataFrame({asset_labels[name]: values for name, values in curve['allocations'].items()})
+        df_curve[axis_labels[axis]] = curve['axes'][axis]
+        fig_curve = px.line(
+            df_curve.melt(id_vars=axis_labels[axis], var_name='Asset', value_name='Percentage'),
+            x=axis_labels[axis], y='Percentage', color='Asset',
+            color_discrete_sequence=['#16A34A', '#6EE7B7', '#A7F3D0'],
+        )
+        fig_curve.add_vline(x=current[axis], line_dash='dash', line_color='#14532D')
+        fig_curve.update_layout(height=350, margin=dict(l=20, r=20, t=20, b=20),
+                                plot_bgcolor='rgba(0,0,0,0)', paper_bgcolor='rgba(0,0,0,0)',
+                                font=dict(color='#14532D'))
+        st.plotly_chart(fig_curve, use_container_width=True)
+
+    with col_heatmap:
+        grid = engine.sweep({'age': 63, 'risk_tolerance': 46}, current)
+        fig_heatmap = px.imshow(
+            grid['allocations']['equity'].T,
+            x=grid['axes']['age'], y=grid['axes']['risk_tolerance'],
+            origin='lower', aspect='auto', color_continuous_scale='Greens',
+            labels=dict(x='อายุ', y='ระดับความเสี่ยง', color='หุ้น (%)'),
+        )
+        fig_heatmap.update_layout(height=350, margin=dict(l=20, r=20, t=20, b=20),
+                                  paper_bgcolor='rgba(0,0,0,0)', font=dict(color='#14532D'))
+        st.plotly_chart(fig_heatmap, use_container_width=True)
+
     # --- (ลบ) st.write("") ออกแล้ว ---
     
     col_btn1, col_btn2, col_btn3 = st.columns([2, 1, 2])
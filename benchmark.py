@@ -0,0 +1,319 @@
+# -----------------------------------------------------------------
+# PROJECT: Fuzzy Investment Advisor
+# FILE: benchmark.py
+# AUTHOR: (Your Name) / Gemini AI
+# REQUIRES: pip install scikit-fuzzy
+# -----------------------------------------------------------------
+#
+# ชุด Benchmark ของ FuzzyInvestmentEngine (ใช้ seed คงที่ ผลจึงเทียบกันข้ามรอบได้)
+#   - เวลาสร้าง engine (__init__)
+#   - latency p50/p95/p99 ของ calculate_portfolio ในแต่ละ backend ('jit' เมื่อติดตั้ง Numba)
+#   - throughput ของ calculate_portfolio_batch
+#   - peak memory (tracemalloc) ตอนสร้าง engine และตอนคำนวณ batch
+#   - ต้นทุนของ get_example_recommendations
+#   - เวลา import โมดูล engine แบบ cold (process ใหม่) เทียบกับ IMPORT_BUDGET
+#   - (--resolution-report) precision / resolution แต่ละแบบ: ความเร็วเทียบกับความคลาดเคลื่อน
+# ผลลัพธ์เขียนเป็น JSON (หนึ่งไฟล์ต่อรอบ) และเทียบกับไฟล์ของรอบก่อนได้ด้วย --compare
+#
+# ตัวอย่าง:
+#   python benchmark.py
+#   python benchmark.py --quick --output bench_results/latest.json --compare bench_results/main.json
+#   python benchmark.py --check-import-budget
+#   python benchmark.py --resolution-report --tolerance 0.05
+# -----------------------------------------------------------------
+
+import argparse
+import datetime
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+import tracemalloc
+
+import numpy as np
+
+from fuzzy_investment_engine import (
+    INPUT_UNIVERSES,
+    FuzzyInvestmentEngine,
+    _jit_kernel,
+    definitions_fingerprint,
+    get_example_recommendations,
+)
+
+SEED = 20240601
+
+# งบเวลา import ของ fuzzy_investment_engine (process ใหม่, ค่าต่ำสุดจากหลายรอบ)
+# วัดได้ราว 0.12 วินาที (แทบทั้งหมดคือ NumPy) เทียบกับราว 0.7 วินาทีตอน import skfuzzy ทันที
+# และต้องไม่มีโมดูลหนักใน forbidden_modules ถูกโหลดตอน import
+IMPORT_BUDGET = {
+    'seconds': 0.3,
+    'forbidden_modules': ('skfuzzy', 'scipy', 'networkx', 'pandas', 'numba'),
+}
+
+# ชุดค่า precision / resolution ที่ --resolution-report เทียบกับค่าเริ่มต้น
+RESOLUTION_CANDIDATES = {
+    'default': {},
+    'float32': {'precision': 'float32'},
+    'coarse': {'resolution': {'income': 5000, 'output': 2}},
+    'adaptive': {'resolution': dict.fromkeys(INPUT_UNIVERSES, 'adaptive') | {'output': 'adaptive'}},
+    'adaptive_float32': {'precision': 'float32',
+                         'resolution': dict.fromkeys(INPUT_UNIVERSES, 'adaptive') | {'output': 'adaptive'}},
+}
+
+# ความคลาดเคลื่อนสูงสุดที่ยอมรับได้ (จุด %) ตอนเลือกชุดค่าที่เร็วที่สุด
+DEFAULT_TOLERANCE = 0.05
+
+_IMPORT_PROBE = (
+    "import json, sys, time\n"
+    "start = time.perf_counter()\n"
+    "import fuzzy_investment_engine\n"
+    "elapsed = time.perf_counter() - start\n"
+    "print(json.dumps({'seconds': elapsed, 'modules': sorted(sys.modules)}))\n"
+)
+
+
+def random_inputs(n, seed=SEED):
+    """Input สุ่มแบบ uniform ครอบคลุมทั้ง universe ของแต่ละตัวแปร (dict ของ array)"""
+    rng = np.random.default_rng(seed)
+    return {name: rng.uniform(lo, hi, n) for name, (lo, hi, _) in INPUT_UNIVERSES.items()}
+
+
+def _percentiles_us(samples):
+    samples = np.asarray(samples) * 1e6
+    p50, p95, p99 = np.percentile(samples, [50, 95, 99])
+    return {'p50_us': p50, 'p95_us': p95, 'p99_us': p99, 'mean_us': samples.mean(), 'calls': samples.size}
+
+
+def bench_construction(repeat):
+    """เวลาสร้าง engine (skfuzzy ControlSystem ทั้งชุด) และ peak memory ตอนสร้าง"""
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        FuzzyInvestmentEngine()
+        timings.append(time.perf_counter() - start)
+
+    tracemalloc.start()
+    engine = FuzzyInvestmentEngine()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    universe_bytes = sum(var.universe.nbytes + sum(term.mf.nbytes for term in var.terms.values())
+                         for var in (engine.age, engine.income, engine.time_horizon, engine.risk_tolerance))
+    return {
+        'seconds_min': min(timings),
+        'seconds_median': float(np.median(timings)),
+        'peak_memory_bytes': peak,
+        'input_membership_bytes': universe_bytes,
+        'income_universe_points': int(engine.income.universe.size),
+    }
+
+
+def bench_latency(calls):
+    """latency ต่อการเรียก calculate_portfolio (Input ไม่ซ้ำกัน จึงไม่โดน cache ของ skfuzzy)"""
+    inputs = random_inputs(calls, SEED + 1)
+    rows = list(zip(*(inputs[name].tolist() for name in INPUT_UNIVERSES)))
+    results = {}
+    backends = ('skfuzzy', 'fused') + (('jit',) if _jit_kernel() is not None else ())
+    for backend in backends:
+        engine = FuzzyInvestmentEngine(backend=backend)
+        engine.calculate_portfolio(*rows[0])   # warm-up (และ compile ของ 'jit')
+        samples = []
+        for row in rows:
+            start = time.perf_counter()
+            engine.calculate_portfolio(*row)
+            samples.append(time.perf_counter() - start)
+        results[backend] = _percentiles_us(samples)
+    return results
+
+
+def bench_batch(sizes):
+    """throughput ของ calculate_portfolio_batch และ peak memory ระหว่างคำนวณ"""
+    engine = FuzzyInvestmentEngine()
+    results = {}
+    for n in sizes:
+        inputs = random_inputs(n, SEED + 2)
+        tracemalloc.start()
+        start = time.perf_counter()
+        engine.calculate_portfolio_batch(inputs)
+        elapsed = time.perf_counter() - start
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        results[str(n)] = {'seconds': elapsed, 'rows_per_sec': n / elapsed, 'peak_memory_bytes': peak}
+    return results
+
+
+def bench_recommendations(calls):
+    """ต้นทุนของ get_example_recommendations ต่อการเรียก"""
+    rng = np.random.default_rng(SEED + 3)
+    allocations = rng.dirichlet([1., 1., 1.], calls) * 100
+    rows = allocations.tolist()
+    start = time.perf_counter()
+    for row in rows:
+        get_example_recommendations(*row)
+    elapsed = time.perf_counter() - start
+    return {'mean_us': elapsed / calls * 1e6, 'calls': calls}
+
+
+def bench_import(repeat):
+    """เวลา import fuzzy_investment_engine ใน process ใหม่ และโมดูลหนักที่ถูกโหลดไปด้วย"""
+    timings = []
+    for _ in range(repeat):
+        out = subprocess.run([sys.executable, '-c', _IMPORT_PROBE], capture_output=True, text=True,
+                             cwd=os.path.dirname(os.path.abspath(__file__)), check=True)
+        probe = json.loads(out.stdout)
+        timings.append(probe['seconds'])
+    loaded = {name.partition('.')[0] for name in probe['modules']}
+    return {
+        'seconds_min': min(timings),
+        'seconds_median': float(np.median(timings)),
+        'heavy_modules_loaded': sorted(loaded.intersection(IMPORT_BUDGET['forbidden_modules'])),
+    }
+
+
+def check_import_budget(result):
+    """คืนรายการข้อที่เกิน IMPORT_BUDGET (list ว่าง = ผ่าน)"""
+    problems = []
+    if result['seconds_min'] > IMPORT_BUDGET['seconds']:
+        problems.append(f"import took {result['seconds_min']:.3f}s (budget {IMPORT_BUDGET['seconds']:.3f}s)")
+    if result['heavy_modules_loaded']:
+        problems.append(f"import loaded heavy modules: {', '.join(result['heavy_modules_loaded'])}")
+    return problems
+
+
+def bench_resolution(candidates=None, tolerance=DEFAULT_TOLERANCE, calls=300, batch_size=100000):
+    """
+    วัด latency ของ calculate_portfolio (skfuzzy), throughput ของ batch path และ
+    deviation_report() ของแต่ละชุดค่า แล้วเลือกชุดที่เร็วที่สุดที่คลาดเคลื่อนไม่เกิน tolerance
+    """
+    candidates = RESOLUTION_CANDIDATES if candidates is None else candidates
+    inputs = random_inputs(batch_size, SEED + 4)
+    rows = list(zip(*(inputs[name][:calls].tolist() for name in INPUT_UNIVERSES)))
+    results = {}
+    for label, options in candidates.items():
+        engine = FuzzyInvestmentEngine(**options)
+        engine.calculate_portfolio(*rows[0])   # warm-up
+        samples = []
+        for row in rows:
+            start = time.perf_counter()
+            engine.calculate_portfolio(*row)
+            samples.append(time.perf_counter() - start)
+        start = time.perf_counter()
+        engine.calculate_portfolio_batch(inputs)
+        elapsed = time.perf_counter() - start
+        results[label] = {
+            'latency': _percentiles_us(samples),
+            'batch_rows_per_sec': batch_size / elapsed,
+            'deviation': engine.deviation_report(n_samples=200),
+        }
+
+    def pick(metric, faster):
+        within = [label for label in results if results[label]['deviation']['max_abs_error'] <= tolerance]
+        return max(within, key=lambda label: faster(results[label][metric]), default=None)
+
+    return {
+        'tolerance': tolerance,
+        'candidates': results,
+        'recommended_scalar': pick('latency', lambda latency: -latency['p50_us']),
+        'recommended_batch': pick('batch_rows_per_sec', lambda rows_per_sec: rows_per_sec),
+    }
+
+
+def _git_commit():
+    try:
+        out = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                             cwd=os.path.dirname(os.path.abspath(__file__)), check=True)
+        return out.stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run(quick=False):
+    """รัน benchmark ทั้งชุดแล้วคืนผลเป็น dict"""
+    return {
+        'meta': {
+            'timestamp': datetime.datetime.now(datetime.timezone.utc).isoformat(),
+            'git_commit': _git_commit(),
+            'definitions': definitions_fingerprint(),
+            'python': platform.python_version(),
+            'numpy': np.__version__,
+            'platform': platform.platform(),
+            'quick': quick,
+        },
+        'construction': bench_construction(repeat=3 if quick else 10),
+        'latency': bench_latency(calls=300 if quick else 2000),
+        'batch': bench_batch([1000, 100000] if quick else [1000, 100000, 1000000]),
+        'recommendations': bench_recommendations(calls=10000 if quick else 100000),
+        'import': bench_import(repeat=3 if quick else 10),
+    }
+
+
+def _flatten(data, prefix=''):
+    flat = {}
+    for key, value in data.items():
+        name = f"{prefix}{key}"
+        if isinstance(value, dict):
+            flat.update(_flatten(value, name + '.'))
+        elif isinstance(value, (int, float)) and not isinstance(value, bool):
+            flat[name] = value
+    return flat
+
+
+def compare(current, baseline):
+    """ตารางเทียบตัวเลขทุกตัวกับผลของรอบก่อน (ratio = ปัจจุบัน / รอบก่อน)"""
+    now, before = _flatten(current), _flatten(baseline)
+    lines = []
+    for name in sorted(now.keys() & before.keys()):
+        if name.startswith('meta.') or not before[name]:
+            continue
+        lines.append(f"{name:55s} {before[name]:>14.4g} -> {now[name]:>14.4g}  x{now[name] / before[name]:.2f}")
+    return '\n'.join(lines)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the Fuzzy Investment Engine.")
+    parser.add_argument('--quick', action='store_true', help="fewer iterations and smaller batches")
+    parser.add_argument('--output', help="JSON file to write (default: bench_results/<timestamp>.json)")
+    parser.add_argument('--compare', metavar='JSON', help="previous result file to compare against")
+    parser.add_argument('--check-import-budget', action='store_true',
+                        help="only measure the engine import time and exit non-zero if over IMPORT_BUDGET")
+    parser.add_argument('--resolution-report', action='store_true',
+                        help="only compare RESOLUTION_CANDIDATES (speed vs. deviation from the default)")
+    parser.add_argument('--tolerance', type=float, default=DEFAULT_TOLERANCE,
+                        help=f"max allowed deviation in percentage points (default: {DEFAULT_TOLERANCE})")
+    args = parser.parse_args(argv)
+
+    if args.resolution_report:
+        print(json.dumps(bench_resolution(tolerance=args.tolerance), indent=2, ensure_ascii=False))
+        return 0
+
+    if args.check_import_budget:
+        result = bench_import(repeat=5)
+        problems = check_import_budget(result)
+        print(json.dumps(result, indent=2))
+        for problem in problems:
+            print(f"FAIL: {problem}", file=sys.stderr)
+        return 1 if problems else 0
+
+    results = run(quick=args.quick)
+
+    output = args.output
+    if output is None:
+        stamp = datetime.datetime.now().strftime('%Y%m%d-%H%M%S')
+        output = os.path.join('bench_results', f'{stamp}.json')
+    os.makedirs(os.path.dirname(output) or '.', exist_ok=True)
+    with open(output, 'w') as f:
+        json.dump(results, f, indent=2)
+    print(f"Results written to {output}")
+
+    if args.compare:
+        with open(args.compare) as f:
+            print(compare(results, json.load(f)))
+    else:
+        print(json.dumps(results, indent=2))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,264 @@
+# -----------------------------------------------------------------
+# PROJECT: Fuzzy Investment Advisor
+# FILE: bulk_score.py
+# AUTHOR: (Your Name) / Gemini AI
+# REQUIRES: pip install scikit-fuzzy pandas (และ pyarrow สำหรับไฟล์ Parquet)
+# -----------------------------------------------------------------
+#
+# ประมวลผลสัดส่วนพอร์ตของลูกค้าทั้งไฟล์ (CSV / Parquet) แบบ streaming:
+# อ่านทีละ chunk -> คำนวณด้วย batch API -> เขียนผลต่อท้ายไฟล์ output ทันที
+# หน่วยความจำจึงคงที่ไม่ว่าไฟล์จะมีกี่แถว
+# แถวที่ Input ไม่ครบ (ว่าง / NaN / inf) ไม่ถูกคำนวณ: คอลัมน์ผลลัพธ์เว้นว่าง
+# และคอลัมน์ missing_inputs ระบุชื่อ Input ที่ขาด
+#
+# ตัวอย่าง:
+#   python bulk_score.py clients.csv scored.csv --chunk-size 50000
+#   python bulk_score.py clients.parquet scored.parquet --column age=client_age
+#   python bulk_score.py clients.csv scored.csv --chunk-size 500000 --workers 0
+#   python bulk_score.py clients.csv scored.csv --chunk-size 1000 --monte-carlo 2000
+#   python bulk_score.py clients.csv scored.csv --store book.npz --id-column client_id \
+#       --type-changes type_changes.csv
+# -----------------------------------------------------------------
+
+import argparse
+import sys
+import time
+
+import pandas as pd
+
+import numpy as np
+
+from fuzzy_investment_engine import (
+    INPUT_NAMES,
+    OUTPUT_NAMES,
+    PORTFOLIO_TYPES,
+    FuzzyInvestmentEngine,
+    get_example_recommendations_batch,
+)
+from incremental_scoring import IncrementalScorer
+from parallel_scoring import MIN_PARALLEL_ROWS, ParallelScorer
+from robustness import robustness_scores
+
+DEFAULT_CHUNK_SIZE = 50000
+
+# คอลัมน์ที่เพิ่มเข้าไปในไฟล์ output (ต่อจากคอลัมน์เดิมของไฟล์ input)
+RESULT_COLUMNS = OUTPUT_NAMES + ('portfolio_type', 'equity_examples', 'bonds_examples', 'cash_examples',
+                                 'missing_inputs')
+
+
+def _is_parquet(path):
+    return str(path).lower().endswith(('.parquet', '.pq'))
+
+
+def _read_chunks(path, chunk_size):
+    """อ่านไฟล์ input ทีละ chunk เป็น DataFrame"""
+    if _is_parquet(path):
+        try:
+            import pyarrow.parquet as pq
+        except ImportError:
+            raise ImportError("Reading Parquet files requires pyarrow: pip install pyarrow")
+        for batch in pq.ParquetFile(path).iter_batches(batch_size=chunk_size):
+            yield batch.to_pandas()
+    else:
+        yield from pd.read_csv(path, chunksize=chunk_size)
+
+
+class _ChunkWriter:
+    """เขียน DataFrame ต่อท้ายไฟล์ output ทีละ chunk (CSV หรือ Parquet)"""
+
+    def __init__(self, path):
+        self.path = path
+        self._parquet_writer = None
+        self._schema = None
+        self._first = True
+
+    def write(self, frame):
+        if _is_parquet(self.path):
+            try:
+                import pyarrow as pa
+                import pyarrow.parquet as pq
+            except ImportError:
+                raise ImportError("Writing Parquet files requires pyarrow: pip install pyarrow")
+            table = pa.Table.from_pandas(frame, preserve_index=False)
+            if self._parquet_writer is None:
+                self._schema = table.schema
+                self._parquet_writer = pq.ParquetWriter(self.path, self._schema)
+            elif not table.schema.equals(self._schema):
+                # pandas เดา dtype ใหม่ทุก chunk (เช่นคอลัมน์ int ที่มีค่าว่างใน chunk หลัง
+                # กลายเป็น float64) -> แปลงกลับเป็น schema ของ chunk แรก
+                try:
+                    table = table.cast(self._schema)
+                except (pa.ArrowInvalid, pa.ArrowNotImplementedError) as e:
+                    raise ValueError(f"Chunk does not fit the output schema of the first chunk "
+                                     f"(raise --chunk-size or fix the column types): {e}") from e
+            self._parquet_writer.write_table(table)
+        else:
+            frame.to_csv(self.path, mode='w' if self._first else 'a', header=self._first, index=False)
+        self._first = False
+
+    def close(self):
+        if self._parquet_writer is not None:
+            self._parquet_writer.close()
+        elif self._first:
+            # ไฟล์ input ว่าง -> เขียนเฉพาะ header ให้มีไฟล์ output เสมอ
+            pd.DataFrame(columns=list(RESULT_COLUMNS)).to_csv(self.path, index=False)
+
+
+def score_frame(engine, frame, column_map=None, monte_carlo=0, incremental=None, seed=0):
+    """
+    คำนวณสัดส่วนพอร์ตและคำแนะนำของทุกแถวใน frame
+    คืน DataFrame เดิมที่เพิ่มคอลัมน์ตาม RESULT_COLUMNS
+
+    monte_carlo: จำนวน sample ต่อแถวของ robustness_scores (0 = ไม่คำนวณ) เพิ่มคอลัมน์
+                 <สินทรัพย์>_mean / _p5 / _p95, p_<ประเภทพอร์ต> และ flip_probability
+    seed:        seed ของ robustness_scores (score_file ส่ง seed ที่ต่างกันให้แต่ละ chunk)
+    incremental: IncrementalScorer -> คำนวณเฉพาะลูกค้าที่ Input เปลี่ยนจากรอบก่อน
+    """
+    column_map = column_map or {}
+    inputs = {name: pd.to_numeric(frame[column_map.get(name, name)], errors='coerce').to_numpy(
+        dtype=float, na_value=np.nan) for name in INPUT_NAMES}
+    # แถวที่ Input ไม่ครบไม่ถูกคำนวณ (engine ปฏิเสธ NaN ทั้ง batch) และถูกระบุใน missing_inputs
+    missing = np.stack([~np.isfinite(inputs[name]) for name in INPUT_NAMES], axis=1)
+    valid = ~missing.any(axis=1)
+    if not valid.all():
+        inputs = {name: values[valid] for name, values in inputs.items()}
+
+    if incremental is None:
+        allocations = engine.calculate_portfolio_batch(inputs)
+    else:
+        allocations = incremental.score(frame[incremental.id_column].to_numpy()[valid], inputs)
+
+    scored = frame.copy()
+    for j, name in enumerate(OUTPUT_NAMES):
+        scored[name] = _scatter(allocations[:, j], valid, np.nan)
+
+    recommendations = get_example_recommendations_batch(
+        *(allocations[:, OUTPUT_NAMES.index(name)] for name in ('equity', 'bonds', 'cash')), separator=', ')
+    for column in ('portfolio_type', 'equity_examples', 'bonds_examples', 'cash_examples'):
+        scored[column] = _scatter(recommendations[column], valid, '')
+    names = np.array(INPUT_NAMES, dtype=object)
+    scored['missing_inputs'] = [','.join(names[row]) for row in missing]
+
+    if monte_carlo:
+        robust = robustness_scores(engine, inputs, n_samples=monte_carlo, percentiles=(5, 95), seed=seed)
+        for j, name in enumerate(OUTPUT_NAMES):
+            scored[f'{name}_mean'] = _scatter(robust['mean'][:, j], valid, np.nan)
+            scored[f'{name}_p5'] = _scatter(robust['percentiles'][5][:, j], valid, np.nan)
+            scored[f'{name}_p95'] = _scatter(robust['percentiles'][95][:, j], valid, np.nan)
+        for t, (key, _) in enumerate(PORTFOLIO_TYPES):
+            scored[f'p_{key}'] = _scatter(robust['type_probability'][:, t], valid, np.nan)
+        scored['flip_probability'] = _scatter(robust['flip_probability'], valid, np.nan)
+    return scored
+
+
+def _scatter(values, valid, fill):
+    """วางผลของแถวที่คำนวณ (values) กลับตามตำแหน่งเดิม แถวที่ Input ไม่ครบได้ค่า fill"""
+    if valid.all():
+        return values
+    out = np.full(valid.shape[0], fill, dtype=values.dtype)
+    out[valid] = values
+    return out
+
+
+def score_file(input_path, output_path, engine=None, chunk_size=DEFAULT_CHUNK_SIZE,
+               column_map=None, progress=None, monte_carlo=0, incremental=None, seed=0):
+    """
+    ประมวลผลทั้งไฟล์แบบ streaming แล้วคืนจำนวนแถวทั้งหมด
+    progress(rows, elapsed_seconds) ถูกเรียกหลังเขียนแต่ละ chunk
+    incremental: IncrementalScorer (บันทึก store ใหม่เมื่อประมวลผลครบทั้งไฟล์แล้วเท่านั้น)
+    seed:        chunk ที่ i ใช้ seed ลูกลำดับ i ของ SeedSequence(seed) กับ monte_carlo
+                 (ถ้าใช้ seed เดียวกันทุก chunk ลูกค้าแถวที่ i ของทุก chunk จะได้ noise ชุดเดียวกัน)
+    """
+    engine = engine or FuzzyInvestmentEngine()
+    writer = _ChunkWriter(output_path)
+    rows = 0
+    start = time.perf_counter()
+    try:
+        for index, frame in enumerate(_read_chunks(input_path, chunk_size)):
+            chunk_seed = np.random.SeedSequence(seed, spawn_key=(index,))
+            writer.write(score_frame(engine, frame, column_map, monte_carlo, incremental, chunk_seed))
+            rows += len(frame)
+            if progress is not None:
+                progress(rows, time.perf_counter() - start)
+    finally:
+        writer.close()
+    if incremental is not None:
+        incremental.commit()
+    return rows
+
+
+def _report_progress(rows, elapsed):
+    rate = rows / elapsed if elapsed > 0 else 0.
+    print(f"{rows:,} rows scored ({rate:,.0f} rows/sec)", file=sys.stderr)
+
+
+def _parse_column_map(items):
+    column_map = {}
+    for item in items or []:
+        name, _, column = item.partition('=')
+        if name not in INPUT_NAMES or not column:
+            raise argparse.ArgumentTypeError(
+                f"Invalid --column '{item}'; expected <input>=<column> with input in {INPUT_NAMES}.")
+        column_map[name] = column
+    return column_map
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Score a client book with the Fuzzy Investment Engine.")
+    parser.add_argument('input', help="CSV or Parquet file with one client per row")
+    parser.add_argument('output', help="CSV or Parquet file to write (format from extension)")
+    parser.add_argument('--chunk-size', type=int, default=DEFAULT_CHUNK_SIZE,
+                        help=f"rows per chunk (default: {DEFAULT_CHUNK_SIZE})")
+    parser.add_argument('--column', action='append', metavar='INPUT=COLUMN',
+                        help=f"map an engine input {INPUT_NAMES} to a column name in the file")
+    parser.add_argument('--artifact', help="compiled engine artifact from save_artifact() to load")
+    parser.add_argument('--workers', type=int, default=1,
+                        help="score each chunk across this many processes (0 = all cores); "
+                             f"chunks under {MIN_PARALLEL_ROWS:,} rows are scored in the main process")
+    parser.add_argument('--monte-carlo', type=int, default=0, metavar='SAMPLES',
+                        help="add robustness columns from this many perturbed inputs per client")
+    parser.add_argument('--seed', type=int, default=0, help="random seed of --monte-carlo (default: 0)")
+    parser.add_argument('--store', metavar='NPZ',
+                        help="previous run's results; only clients whose inputs changed are re-scored")
+    parser.add_argument('--id-column', default='client_id', help="client id column used with --store")
+    parser.add_argument('--type-changes', metavar='CSV',
+                        help="with --store, write clients whose portfolio type changed since the last run")
+    args = parser.parse_args(argv)
+
+    try:
+        column_map = _parse_column_map(args.column)
+    except argparse.ArgumentTypeError as e:
+        parser.error(str(e))
+    if args.type_changes and not args.store:
+        parser.error("--type-changes requires --store")
+    if args.workers != 1 and args.chunk_size < MIN_PARALLEL_ROWS:
+        print(f"Warning: --chunk-size {args.chunk_size:,} is below {MIN_PARALLEL_ROWS:,} rows, "
+              "so --workers has no effect", file=sys.stderr)
+
+    def run(engine):
+        incremental = IncrementalScorer(engine, args.store, args.id_column) if args.store else None
+        rows = score_file(args.input, args.output, engine, args.chunk_size, column_map,
+                          _report_progress, args.monte_carlo, incremental, args.seed)
+        return rows, incremental
+
+    if args.workers == 1:
+        rows, incremental = run(FuzzyInvestmentEngine(artifact=args.artifact))
+    else:
+        with ParallelScorer(args.workers or None, artifact=args.artifact) as scorer:
+            rows, incremental = run(scorer)
+    print(f"Done: {rows:,} rows written to {args.output}", file=sys.stderr)
+
+    if incremental is not None:
+        changes = incremental.type_changes()
+        counts = incremental.counts
+        note = " (definitions changed: store invalidated)" if incremental.invalidated else ""
+        print(f"Store: {counts['reused']:,} reused, {counts['rescored']:,} re-scored, {counts['new']:,} new; "
+              f"{len(changes):,} portfolio type changes{note}", file=sys.stderr)
+        if args.type_changes:
+            pd.DataFrame(changes, columns=[args.id_column, 'previous_portfolio_type', 'portfolio_type']).to_csv(
+                args.type_changes, index=False)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,265 @@
+# -----------------------------------------------------------------
+# PROJECT: Fuzzy Investment Advisor
+# FILE: calibration.py
+# AUTHOR: (Your Name) / Gemini AI
+# REQUIRES: pip install numpy pandas
+# -----------------------------------------------------------------
+#
+# ปรับ breakpoints ของ Membership functions (INPUT_TERMS / spec) ให้ตรงกับสัดส่วนพอร์ต
+# ที่ที่ปรึกษาอนุมัติไว้ในอดีต
+#
+# breakpoints ของ term ที่กฎใช้ (ยกเว้นที่ขอบ universe) เป็นพารามิเตอร์ ค่า loss (MSE ของสัดส่วน
+# ทุกสินทรัพย์ หน่วยจุด %) ของ candidate หนึ่งชุดคำนวณด้วย fused kernel ทั้ง dataset ใน
+# batch เดียว การค้นหาเป็น evolution strategy แบบ (1 + λ): ทุกรอบสุ่ม candidate λ ชุดรอบ
+# ค่าที่ดีที่สุด แล้วกระจายการคำนวณ loss ไปหลาย process (แต่ละ worker ได้ dataset ครั้งเดียว)
+# ผลลัพธ์เป็นไฟล์ spec (JSON) ที่ใช้กับ FuzzyInvestmentEngine(spec=...) ได้ทันที
+#
+# ตัวอย่าง:
+#   python calibration.py decisions.csv fitted_spec.json --generations 60 --population 16 --workers 0
+#   (decisions.csv: คอลัมน์ age, income, time_horizon, risk_tolerance, equity, bonds, cash)
+# -----------------------------------------------------------------
+
+import argparse
+import copy
+import json
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from fuzzy_investment_engine import (
+    INPUT_NAMES,
+    CompiledRuleBase,
+    _evaluate_batch,
+    _prepare_batch_inputs,
+    compile_spec,
+    default_spec,
+)
+from parallel_scoring import available_cores
+
+DEFAULT_GENERATIONS = 40
+DEFAULT_POPULATION = 16
+
+# ขนาดก้าวเริ่มต้น / ต่ำสุดของการสุ่ม (สัดส่วนของความกว้าง universe)
+DEFAULT_SIGMA = 0.02
+MIN_SIGMA = 1e-4
+
+# จำนวนพารามิเตอร์เฉลี่ยที่ถูกสุ่มเปลี่ยนต่อ candidate (เปลี่ยนทีละน้อยตัวสำเร็จบ่อยกว่าเปลี่ยนทุกตัว)
+MUTATED_PARAMETERS = 2
+
+# ปรับขนาดก้าวตามผลของแต่ละรอบ: พบค่าที่ดีขึ้น -> ขยาย, ไม่พบ -> หด
+SIGMA_GROWTH = 1.3
+SIGMA_SHRINK = 0.7
+
+# ตำแหน่งใน term_points [a, b, c, d] ของแต่ละ breakpoint ใน spec (trimf: b ใช้ทั้งช่อง 1 และ 2)
+_POINT_COLUMNS = {'trapmf': ((0,), (1,), (2,), (3,)), 'trimf': ((0,), (1, 2), (3,))}
+
+
+class BreakpointParameters:
+    """
+    แปลงระหว่าง spec กับเวกเตอร์พารามิเตอร์ของ breakpoints ที่ปรับได้
+    (breakpoints ที่อยู่ที่ขอบ universe พอดี เช่นขาแนวตั้งของ trapmf ที่ขอบ และ breakpoints
+    ของ term ที่ไม่มีกฎใดอ้างถึง ถูกตรึงไว้ เพราะไม่มีผลต่อสัดส่วนพอร์ต)
+    """
+
+    def __init__(self, spec):
+        self.spec = spec
+        rulebase = compile_spec(spec)
+        k = rulebase.term_var.size
+        used = set((rulebase.clause_literals[rulebase.clause_literals < 2 * k] % k).tolist())
+        self.terms = []        # (ตัวแปร, label, ชนิด, breakpoints เดิม)
+        self.free = []         # (index ของ term, ตำแหน่ง breakpoint)
+        self.width = []        # ความกว้าง universe ของแต่ละพารามิเตอร์
+        self.bounds = []       # (lo, hi) ของแต่ละพารามิเตอร์
+        for name in INPUT_NAMES:
+            lo, hi, _ = spec['inputs'][name]['universe']
+            for label, (kind, params) in spec['inputs'][name]['terms'].items():
+                for j, value in enumerate(params):
+                    if len(self.terms) in used and lo < value < hi:
+                        self.free.append((len(self.terms), j))
+                        self.width.append(hi - lo)
+                        self.bounds.append((lo, hi))
+                self.terms.append((name, label, kind, [float(value) for value in params]))
+        self.width = np.array(self.width, dtype=float)
+        self.bounds = np.array(self.bounds, dtype=float).reshape(-1, 2)
+
+    def initial(self):
+        return np.array([self.terms[t][3][j] for t, j in self.free])
+
+    def _term_params(self, theta):
+        params = [list(values) for _, _, _, values in self.terms]
+        for (t, j), value in zip(self.free, theta):
+            params[t][j] = float(value)
+        # breakpoints ของ term ต้องเรียงจากน้อยไปมาก
+        return [sorted(values) for values in params]
+
+    def project(self, theta):
+        """ตัดให้อยู่ใน universe และเรียง breakpoints ภายในแต่ละ term"""
+        theta = np.clip(theta, self.bounds[:, 0], self.bounds[:, 1])
+        params = self._term_params(theta)
+        return np.array([params[t][j] for t, j in self.free])
+
+    def term_points(self, theta):
+        """term_points (K, 4) ของ CompiledRuleBase สำหรับพารามิเตอร์ theta"""
+        points = np.empty((len(self.terms), 4))
+        for t, values in enumerate(self._term_params(theta)):
+            for value, columns in zip(values, _POINT_COLUMNS[self.terms[t][2]]):
+                points[t, list(columns)] = value
+        return points
+
+    def to_spec(self, theta, steps=False):
+        """spec ใหม่ที่ใช้ breakpoints จาก theta (steps=True -> ปัดให้อยู่บนจุดของ universe)"""
+        spec = copy.deepcopy(self.spec)
+        for (name, label, kind, _), values in zip(self.terms, self._term_params(theta)):
+            if steps:
+                lo, _, step = spec['inputs'][name]['universe']
+                values = [lo + round((value - lo) / step) * step for value in values]
+            spec['inputs'][name]['terms'][label] = [kind, [round(value, 6) for value in values]]
+        return spec
+
+
+def _loss(rulebase, inputs, targets, defuzz):
+    predicted = _evaluate_batch(inputs, defuzz, None, rulebase)
+    return float(np.mean((predicted - targets) ** 2))
+
+
+# state ของ worker process (ตั้งใน _init_worker ครั้งเดียวต่อ process)
+_worker = None
+
+
+def _init_worker(spec, inputs, targets, defuzz, precision):
+    global _worker
+    _worker = _Evaluator(spec, inputs, targets, defuzz, precision)
+
+
+def _worker_loss(term_points):
+    return _worker(term_points)
+
+
+class _Evaluator:
+    """คำนวณ loss ของ term_points หนึ่งชุดบน dataset ทั้งหมดในรอบเดียว"""
+
+    def __init__(self, spec, inputs, targets, defuzz, precision):
+        self.base = compile_spec(spec)
+        self.dtype = np.dtype(precision)
+        self.inputs = {name: values.astype(self.dtype) for name, values in inputs.items()}
+        self.targets = targets
+        self.defuzz = defuzz
+
+    def __call__(self, term_points):
+        arrays = {key: getattr(self.base, key) for key in CompiledRuleBase.ARRAY_NAMES}
+        arrays['term_points'] = term_points
+        arrays = {key: arr.astype(self.dtype) if arr.dtype.kind == 'f' else arr for key, arr in arrays.items()}
+        rulebase = CompiledRuleBase(arrays, self.base.spec, self.base.fingerprint)
+        return _loss(rulebase, self.inputs, self.targets, self.defuzz)
+
+
+def calibrate(inputs, targets, spec=None, generations=DEFAULT_GENERATIONS, population=DEFAULT_POPULATION,
+              sigma=DEFAULT_SIGMA, workers=1, defuzz='analytic', precision='float64', seed=0, progress=None):
+    """
+    ปรับ breakpoints ของ spec (ค่าเริ่มต้น: นิยามใน PART 0) ให้สัดส่วนพอร์ตใกล้ targets ที่สุด
+
+    inputs:   DataFrame / dict ของ array ตาม INPUT_NAMES
+    targets:  array (N, O) ของสัดส่วนที่อนุมัติ เรียงคอลัมน์ตาม outputs ของ spec
+    workers:  จำนวน process ที่ใช้คำนวณ loss ของ candidate พร้อมกัน (None = ทุก core)
+    progress: progress(generation, best_loss, sigma) ถูกเรียกทุกรอบ
+    คืน dict: 'spec' (ปัด breakpoints ให้อยู่บนจุดของ universe แล้ว), 'loss' ก่อน/หลัง และ 'history'
+    """
+    spec = default_spec() if spec is None else spec
+    inputs = _prepare_batch_inputs(inputs, rulebase=compile_spec(spec))
+    targets = np.asarray(targets, dtype=float)
+    if targets.shape != (inputs[INPUT_NAMES[0]].shape[0], len(spec['outputs'])):
+        raise ValueError(f"Targets must have shape (N, {len(spec['outputs'])}) matching the inputs.")
+
+    params = BreakpointParameters(spec)
+    rng = np.random.default_rng(seed)
+    workers = workers or available_cores()
+    evaluator = _Evaluator(spec, inputs, targets, defuzz, precision)
+    executor = None
+    if workers > 1:
+        executor = ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                                       initargs=(spec, inputs, targets, defuzz, precision))
+
+    best = params.initial()
+    best_loss = initial_loss = evaluator(params.term_points(best))
+    history = [best_loss]
+    try:
+        for generation in range(generations):
+            if sigma < MIN_SIGMA:
+                break
+            candidates = []
+            for _ in range(population):
+                mutated = rng.random(best.shape) < MUTATED_PARAMETERS / best.size
+                mutated[rng.integers(best.size)] = True
+                step = rng.normal(0., sigma, best.shape) * params.width * mutated
+                candidates.append(params.project(best + step))
+            points = [params.term_points(theta) for theta in candidates]
+            losses = list(executor.map(_worker_loss, points)) if executor else [evaluator(p) for p in points]
+
+            winner = int(np.argmin(losses))
+            if losses[winner] < best_loss:
+                best, best_loss = candidates[winner], losses[winner]
+                sigma *= SIGMA_GROWTH
+            else:
+                sigma *= SIGMA_SHRINK
+            history.append(best_loss)
+            if progress is not None:
+                progress(generation + 1, best_loss, sigma)
+    finally:
+        if executor is not None:
+            executor.shutdown()
+
+    fitted = params.to_spec(best, steps=True)
+    return {
+        'spec': fitted,
+        'initial_loss': initial_loss,
+        'fitted_loss': best_loss,
+        'rounded_loss': evaluator(compile_spec(fitted).term_points),
+        'history': history,
+    }
+
+
+def _report_progress(generation, loss, sigma):
+    print(f"generation {generation}: loss {loss:.4f} (sigma {sigma:.4f})", file=sys.stderr)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Fit membership breakpoints to historical approved allocations.")
+    parser.add_argument('decisions', help="CSV or Parquet with input columns and approved allocation columns")
+    parser.add_argument('output', help="JSON spec file to write")
+    parser.add_argument('--spec', help="starting spec file (default: built-in definitions)")
+    parser.add_argument('--generations', type=int, default=DEFAULT_GENERATIONS)
+    parser.add_argument('--population', type=int, default=DEFAULT_POPULATION, help="candidates per generation")
+    parser.add_argument('--sigma', type=float, default=DEFAULT_SIGMA,
+                        help="initial step as a fraction of each universe's width")
+    parser.add_argument('--workers', type=int, default=1, help="processes evaluating candidates (0 = all cores)")
+    parser.add_argument('--sample', type=int, help="fit on a random sample of this many rows")
+    parser.add_argument('--precision', choices=('float64', 'float32'), default='float64')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args(argv)
+
+    import pandas as pd
+    spec = compile_spec(args.spec).spec if args.spec else default_spec()
+    if str(args.decisions).lower().endswith(('.parquet', '.pq')):
+        frame = pd.read_parquet(args.decisions)
+    else:
+        frame = pd.read_csv(args.decisions)
+    if args.sample and args.sample < len(frame):
+        frame = frame.sample(args.sample, random_state=args.seed)
+
+    start = time.perf_counter()
+    result = calibrate({name: frame[name].to_numpy() for name in INPUT_NAMES},
+                       frame[list(spec['outputs'])].to_numpy(), spec, args.generations, args.population,
+                       args.sigma, args.workers or None, precision=args.precision, seed=args.seed,
+                       progress=_report_progress)
+    with open(args.output, 'w') as f:
+        json.dump(result['spec'], f, indent=2, ensure_ascii=False)
+    print(f"Loss {result['initial_loss']:.4f} -> {result['fitted_loss']:.4f} "
+          f"({result['rounded_loss']:.4f} on universe steps) in {time.perf_counter() - start:.1f}s; "
+          f"spec written to {args.output}", file=sys.stderr)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
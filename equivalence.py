@@ -0,0 +1,332 @@
+# -----------------------------------------------------------------
+# PROJECT: Fuzzy Investment Advisor
+# FILE: equivalence.py
+# AUTHOR: (Your Name) / Gemini AI
+# REQUIRES: pip install scikit-fuzzy
+# -----------------------------------------------------------------
+#
+# ตรวจว่า path ที่เร็วกว่า (fused analytic, defuzz='universe', float32, Numba JIT)
+# ให้สัดส่วนพอร์ตเท่ากับ ControlSystemSimulation ของ skfuzzy
+#
+# skfuzzy คำนวณได้ทีละแถว (~1 ms) จึงใช้ reference_batch แทน: คำนวณแบบ vectorized
+# ด้วยวิธีเดียวกับ skfuzzy ทุกขั้น (membership ที่ sample บน universe + interp,
+# Output บน universe ที่เติมจุดตัดกับระดับ cut ของแต่ละ term แบบ find_memberships)
+# แล้วยืนยันว่า reference_batch ตรงกับ skfuzzy จริงด้วยการสุ่มตรวจบางแถว
+#
+# ชุด Input ที่ตรวจ:
+#   grid      - ผลคูณของ grid ทุก Input ตาม DEFAULT_GRID_STEPS: ค่าเริ่มต้นเป็น grid ที่ subsample
+#               แล้ว (income ทุก 5,000 บาท = 98 จาก 486 จุดของ universe, ~1.9M แถว)
+#               ไม่ใช่ทุกจุดของ universe; ตรวจทุกจุดด้วย --grid-step income=1000
+#               (~9.2M แถว ใช้เวลาราวหนึ่งนาทีต่อ path) รายงานระบุจำนวนจุดไว้ใน 'grid'
+#   random    - สุ่ม uniform ทั่ว universe
+#   boundary  - ผลคูณของจุดวิกฤตทุกตัวแปร: ขอบ universe (เช่น income 15,000 / 500,000)
+#               และ breakpoints ของ trapmf/trimf ทุกตัว รวมถึงจุดที่อยู่ห่างไป ±BOUNDARY_OFFSET
+#   threshold - แถวจากทุกชุดที่หุ้นอยู่ใกล้เกณฑ์ 40% / 70% (ภายใน THRESHOLD_BAND จุด %)
+#   scalar    - แถวสุ่มจากชุด random คำนวณทีละแถวด้วย calculate_portfolio (path ของ scalar
+#               แยกจาก batch ในทุก backend)
+#
+# ตัวอย่าง:
+#   python equivalence.py
+#   python equivalence.py --paths analytic,float32 --grid-step income=1000 --output report.json
+# -----------------------------------------------------------------
+
+import argparse
+import json
+import sys
+import time
+
+import numpy as np
+
+from fuzzy_investment_engine import (
+    INPUT_NAMES,
+    PORTFOLIO_TYPE_THRESHOLDS,
+    _MEMBERSHIP_FUNCS,
+    FuzzyInvestmentEngine,
+    _input_universe,
+    _output_universe,
+    _polyline_centroid,
+    _prepare_batch_inputs,
+    classify_portfolio_types,
+    default_rulebase,
+)
+
+# path ที่ตรวจได้: ชื่อ -> (ตัวเลือกของ FuzzyInvestmentEngine, tolerance สูงสุดที่ยอมรับ (จุด %))
+# 'jit' ไม่มี Numba -> ตรวจ NumPy fallback แทน (รายงานระบุไว้ใน 'numba')
+PATHS = {
+    'analytic': ({'backend': 'fused'}, 0.05),
+    'universe': ({'backend': 'fused', 'defuzz': 'universe'}, 0.5),
+    'float32': ({'backend': 'fused', 'precision': 'float32'}, 0.05),
+    'jit': ({'backend': 'jit'}, 0.05),
+}
+DEFAULT_PATHS = ('analytic', 'universe', 'float32', 'jit')
+
+# ขนาด step ของ grid ในชุด grid (ทุก breakpoint ใน INPUT_TERMS อยู่บน grid นี้)
+# income หยาบกว่า step ของ universe (1,000 บาท) เพื่อให้ตรวจทั้งชุดเสร็จในไม่กี่วินาที
+DEFAULT_GRID_STEPS = {
+    'age': 1,
+    'income': 5000,
+    'time_horizon': 1,
+    'risk_tolerance': 1,
+}
+
+DEFAULT_RANDOM_SAMPLES = 100000
+DEFAULT_SPOT_CHECKS = 300
+
+# ระยะห่างจาก breakpoints ของจุดใน boundary (สัดส่วนของความกว้าง universe)
+BOUNDARY_OFFSET = 1e-4
+
+# แถวที่หุ้นห่างจากเกณฑ์ประเภทพอร์ตไม่เกินค่านี้ (จุด %) ถูกรวมไว้ในชุด threshold
+THRESHOLD_BAND = 1.0
+
+# จำนวนแถวต่อรอบของ reference_batch (จำกัดขนาด array ชั่วคราว)
+REFERENCE_CHUNK_SIZE = 65536
+
+
+def _sampled_memberships(rulebase):
+    """membership ของทุก term ที่ sample บน universe แบบเดียวกับ skfuzzy"""
+    spec = rulebase.spec
+    inputs = {}
+    for name in INPUT_NAMES:
+        universe = _input_universe(name, spec).astype(float)
+        mfs = [_MEMBERSHIP_FUNCS[kind](universe, params) for kind, params in spec['inputs'][name]['terms'].values()]
+        inputs[name] = (universe, np.array(mfs))
+    universe = _output_universe(spec).astype(float)
+    outputs = np.array([_MEMBERSHIP_FUNCS['trimf'](universe, abc) for abc in rulebase.output_points.tolist()])
+    return inputs, universe, outputs
+
+
+def _defuzz_skfuzzy_batch(cuts, universe, output_points, output_mfs):
+    """
+    Centroid แบบ ControlSystemSimulation: universe Output + จุดที่แต่ละ term มีค่าเท่ากับ
+    ระดับ cut ของ term นั้นเอง (find_memberships) แล้ว aggregate ด้วย max ของ min(cut, mf)
+    cuts (N, O, T) -> raw (N, O)
+    """
+    lo, hi = universe[0], universe[-1]
+    crossings = [np.broadcast_to(universe, cuts.shape[:2] + universe.shape)]
+    for t, (a, b, c) in enumerate(output_points):
+        crossings.append(np.clip(a + cuts[..., t:t + 1] * (b - a), lo, hi))
+        crossings.append(np.clip(c - cuts[..., t:t + 1] * (c - b), lo, hi))
+    x = np.sort(np.concatenate(crossings, axis=-1), axis=-1)
+
+    y = np.zeros_like(x)
+    for t, mf in enumerate(output_mfs):
+        np.fmax(y, np.fmin(cuts[..., t, None], np.interp(x, universe, mf)), out=y)
+    moment, area = _polyline_centroid(x, y)
+    return np.divide(moment, area, out=np.zeros_like(area), where=area > 0)
+
+
+def _unique_rows(values):
+    """แถวที่ไม่ซ้ำกัน (เรียงด้วย lexsort ซึ่งเร็วกว่า np.unique(axis=0) มาก) -> (unique, inverse)"""
+    order = np.lexsort(values.T[::-1])
+    ordered = values[order]
+    starts = np.concatenate([[True], np.any(ordered[1:] != ordered[:-1], axis=1)])
+    inverse = np.empty(values.shape[0], dtype=np.intp)
+    inverse[order] = np.cumsum(starts) - 1
+    return ordered[starts], inverse
+
+
+def reference_batch(inputs, rulebase=None):
+    """
+    สัดส่วนพอร์ตแบบ ControlSystemSimulation ของ skfuzzy คำนวณแบบ vectorized -> array (N, O)
+    (แถวที่ firing strength ซ้ำกันถูก Defuzzify ครั้งเดียว: บน grid มีค่าไม่ซ้ำกันไม่มาก)
+    """
+    rulebase = default_rulebase() if rulebase is None else rulebase
+    memberships, universe, output_mfs = _sampled_memberships(rulebase)
+    inputs = _prepare_batch_inputs(inputs, rulebase=rulebase)
+    n = inputs[INPUT_NAMES[0]].shape[0]
+
+    strengths = np.empty((n, rulebase.rule_clauses.size))
+    for start in range(0, n, REFERENCE_CHUNK_SIZE):
+        mu = np.concatenate([
+            np.stack([np.interp(inputs[name][start:start + REFERENCE_CHUNK_SIZE], grid, mf) for mf in mfs], axis=1)
+            for name, (grid, mfs) in memberships.items()
+        ], axis=1)
+        strengths[start:start + REFERENCE_CHUNK_SIZE] = rulebase.fire(mu)
+
+    unique, inverse = _unique_rows(strengths)
+    raw = np.empty((unique.shape[0], len(rulebase.output_names)))
+    for start in range(0, unique.shape[0], REFERENCE_CHUNK_SIZE):
+        cuts = rulebase.term_cuts(unique[start:start + REFERENCE_CHUNK_SIZE])
+        raw[start:start + REFERENCE_CHUNK_SIZE] = _defuzz_skfuzzy_batch(
+            cuts, universe, rulebase.output_points.tolist(), output_mfs)
+    return rulebase.normalize(raw)[inverse]
+
+
+def input_grid(steps=None, rulebase=None):
+    """grid ของแต่ละ Input ตาม step ที่กำหนด (ครอบคลุมทั้ง universe)"""
+    rulebase = default_rulebase() if rulebase is None else rulebase
+    steps = dict(DEFAULT_GRID_STEPS, **(steps or {}))
+    return {name: np.append(np.arange(lo, hi, steps[name], dtype=float), float(hi))
+            for name, (lo, hi) in zip(INPUT_NAMES, rulebase.input_bounds)}
+
+
+def grid_coverage(grid_steps=None, rulebase=None):
+    """จำนวนจุดของ grid เทียบกับจำนวนจุดของ universe ต่อ Input -> {ตัวแปร: {'points', 'universe_points'}}"""
+    grid = input_grid(grid_steps, rulebase)
+    spec = None if rulebase is None else rulebase.spec
+    return {name: {'points': int(grid[name].size), 'universe_points': int(_input_universe(name, spec).size)}
+            for name in INPUT_NAMES}
+
+
+def verification_cases(grid_steps=None, n_random=DEFAULT_RANDOM_SAMPLES, seed=0, rulebase=None):
+    """ชุด Input ที่ใช้ตรวจ: {'grid' | 'random' | 'boundary': {ตัวแปร: array}}"""
+    rulebase = default_rulebase() if rulebase is None else rulebase
+    rng = np.random.default_rng(seed)
+
+    def product(axes):
+        mesh = np.meshgrid(*(axes[name] for name in INPUT_NAMES), indexing='ij')
+        return {name: m.ravel() for name, m in zip(INPUT_NAMES, mesh)}
+
+    critical = {}
+    for v, name in enumerate(INPUT_NAMES):
+        lo, hi = rulebase.input_bounds[v]
+        points = np.append(rulebase.term_points[rulebase.term_slices[name]].ravel(), [lo, hi])
+        offset = BOUNDARY_OFFSET * (hi - lo)
+        critical[name] = np.unique(np.clip(np.concatenate([points - offset, points, points + offset]), lo, hi))
+
+    return {
+        'grid': product(input_grid(grid_steps, rulebase)),
+        'random': {name: rng.uniform(lo, hi, n_random) for name, (lo, hi) in zip(INPUT_NAMES, rulebase.input_bounds)},
+        'boundary': product(critical),
+    }
+
+
+def _compare(approx, exact):
+    errors = np.abs(np.asarray(approx, dtype=float) - exact)
+    types = classify_portfolio_types(approx[:, 0])
+    expected = classify_portfolio_types(exact[:, 0])
+    return {
+        'n': int(errors.shape[0]),
+        'max_abs_error': errors.max(axis=0).tolist() if errors.size else [0.] * errors.shape[1],
+        'mean_abs_error': errors.mean(axis=0).tolist() if errors.size else [0.] * errors.shape[1],
+        'type_mismatches': int(np.count_nonzero(types != expected)),
+    }
+
+
+def _scalar_results(engine, inputs, rows):
+    """calculate_portfolio ทีละแถวของ rows -> array (len(rows), O)"""
+    return np.array([list(engine.calculate_portfolio(*(inputs[name][i] for name in INPUT_NAMES)).values())
+                     for i in rows])
+
+
+def spot_check(inputs, exact, n_checks=DEFAULT_SPOT_CHECKS, seed=0):
+    """สุ่มแถวไปคำนวณด้วย skfuzzy จริง เพื่อยืนยันว่า reference_batch ตรงกับ ControlSystemSimulation"""
+    rows = np.random.default_rng(seed).choice(exact.shape[0], min(n_checks, exact.shape[0]), replace=False)
+    return _compare(_scalar_results(FuzzyInvestmentEngine(), inputs, rows), exact[rows])
+
+
+def verify(paths=DEFAULT_PATHS, grid_steps=None, n_random=DEFAULT_RANDOM_SAMPLES,
+           n_spot_checks=DEFAULT_SPOT_CHECKS, seed=0):
+    """
+    ตรวจทุก path ใน paths (ชื่อจาก PATHS) กับ reference บนทุกชุด Input
+    คืนรายงาน: ต่อ path ต่อชุด -> n, max/mean absolute error ต่อสินทรัพย์ (ตาม OUTPUT_NAMES),
+    จำนวนแถวที่ประเภทพอร์ตไม่ตรงกัน และ passed (max error ไม่เกิน tolerance ของ path)
+    'grid' / 'grid_subsampled': จำนวนจุดของชุด grid เทียบกับ universe (ค่าเริ่มต้น income ไม่ครบทุกจุด)
+    """
+    unknown = sorted(set(paths) - set(PATHS))
+    if unknown:
+        raise ValueError(f"Unknown paths {unknown}; expected names from {list(PATHS)}.")
+    rulebase = default_rulebase()
+    if rulebase.output_names[0] != 'equity':
+        raise ValueError("Verification expects 'equity' as the first output.")
+
+    started = time.perf_counter()
+    cases = verification_cases(grid_steps, n_random, seed, rulebase)
+    exact = {case: reference_batch(inputs, rulebase) for case, inputs in cases.items()}
+    coverage = grid_coverage(grid_steps, rulebase)
+    report = {
+        'outputs': list(rulebase.output_names),
+        'grid': coverage,
+        'grid_subsampled': any(c['points'] < c['universe_points'] for c in coverage.values()),
+        'reference_seconds': time.perf_counter() - started,
+        'reference_vs_skfuzzy': spot_check(cases['random'], exact['random'], n_spot_checks, seed),
+        'paths': {},
+    }
+
+    # แถวที่หุ้นใกล้เกณฑ์ 40% / 70% จากทุกชุด
+    near = {case: np.min(np.abs(values[:, :1] - np.array(PORTFOLIO_TYPE_THRESHOLDS)), axis=1) <= THRESHOLD_BAND
+            for case, values in exact.items()}
+    # แถวที่ตรวจผ่าน calculate_portfolio (ชุดเดียวกันทุก path)
+    scalar_rows = np.random.default_rng(seed + 1).choice(
+        exact['random'].shape[0], min(n_spot_checks, exact['random'].shape[0]), replace=False)
+
+    for path in paths:
+        options, tolerance = PATHS[path]
+        started = time.perf_counter()
+        engine = FuzzyInvestmentEngine(**options)
+        results = {}
+        approx_near, exact_near = [], []
+        for case, inputs in cases.items():
+            approx = engine.calculate_portfolio_batch(inputs)
+            results[case] = _compare(approx, exact[case])
+            approx_near.append(approx[near[case]])
+            exact_near.append(exact[case][near[case]])
+        results['threshold'] = _compare(np.concatenate(approx_near), np.concatenate(exact_near))
+        results['scalar'] = _compare(_scalar_results(engine, cases['random'], scalar_rows),
+                                     exact['random'][scalar_rows])
+        worst = max(max(result['max_abs_error']) for result in results.values())
+        report['paths'][path] = {
+            'tolerance': tolerance,
+            'max_abs_error': worst,
+            'passed': worst <= tolerance,
+            'seconds': time.perf_counter() - started,
+            'cases': results,
+        }
+        if options.get('backend') == 'jit':
+            report['paths'][path]['numba'] = engine.jit is not None
+    return report
+
+
+def _parse_steps(items):
+    steps = {}
+    for item in items or ():
+        name, _, value = item.partition('=')
+        if name not in INPUT_NAMES or not value:
+            raise argparse.ArgumentTypeError(f"Expected NAME=STEP with NAME in {INPUT_NAMES}, got '{item}'.")
+        steps[name] = float(value)
+    return steps
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Verify fast evaluation paths against the skfuzzy reference.")
+    parser.add_argument('--paths', default=','.join(DEFAULT_PATHS),
+                        help=f"comma-separated paths from {list(PATHS)} (default: {','.join(DEFAULT_PATHS)})")
+    parser.add_argument('--grid-step', action='append', metavar='NAME=STEP',
+                        help="override a step of DEFAULT_GRID_STEPS (repeatable)")
+    parser.add_argument('--random', type=int, default=DEFAULT_RANDOM_SAMPLES, help="random cases")
+    parser.add_argument('--spot-checks', type=int, default=DEFAULT_SPOT_CHECKS,
+                        help="rows checked against the real skfuzzy simulation")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', help="also write the full report as JSON")
+    args = parser.parse_args(argv)
+
+    try:
+        steps = _parse_steps(args.grid_step)
+    except argparse.ArgumentTypeError as e:
+        parser.error(str(e))
+    report = verify(args.paths.split(','), steps, args.random, args.spot_checks, args.seed)
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+
+    if report['grid_subsampled']:
+        sparse = ', '.join(f"{name} {c['points']}/{c['universe_points']}" for name, c in report['grid'].items()
+                           if c['points'] < c['universe_points'])
+        print(f"grid is subsampled ({sparse} universe points); pass --grid-step to check every point")
+    spot = report['reference_vs_skfuzzy']
+    print(f"reference vs skfuzzy ({spot['n']} rows): max {max(spot['max_abs_error']):.2e}, "
+          f"type mismatches {spot['type_mismatches']}  [{report['reference_seconds']:.1f}s]")
+    for path, result in report['paths'].items():
+        status = 'PASS' if result['passed'] else 'FAIL'
+        note = '' if result.get('numba', True) else ' (Numba not installed: NumPy fallback)'
+        print(f"{path}: {status} max {result['max_abs_error']:.4f} (tolerance {result['tolerance']})"
+              f"  [{result['seconds']:.1f}s]{note}")
+        for case, stats in result['cases'].items():
+            errors = ', '.join(f"{name} {err:.4f}/{mean:.5f}" for name, err, mean in
+                               zip(report['outputs'], stats['max_abs_error'], stats['mean_abs_error']))
+            print(f"  {case:10s} n={stats['n']:<8d} max/mean {errors}  type mismatches {stats['type_mismatches']}")
+    return 0 if all(result['passed'] for result in report['paths'].values()) else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -2,12 +2,1146 @@
 # PROJECT: Fuzzy Investment Advisor
 # FILE: fuzzy_investment_engine.py
 # AUTHOR: (Your Name) / Gemini AI
-# REQUIRES: pip install scikit-fuzzy
+# REQUIRES: pip install numpy (และ scikit-fuzzy สำหรับ backend 'skfuzzy', numba สำหรับ backend 'jit')
 # -----------------------------------------------------------------
+#
+# import โมดูลนี้โหลดแค่ NumPy: skfuzzy (ซึ่งโหลด SciPy และ NetworkX ต่อ) จะถูก import
+# ครั้งแรกที่ต้องสร้าง ControlSystem จริงเท่านั้น ส่วน backend 'fused', batch path
+# และ artifact ใช้ NumPy ล้วน (งบเวลา import ดู IMPORT_BUDGET ใน benchmark.py)
+# Numba ก็ถูก import เฉพาะเมื่อสร้าง engine ด้วย backend='jit' เท่านั้น
+# -----------------------------------------------------------------
+
+import ast
+import bisect
+import collections
+import contextlib
+import functools
+import hashlib
+import itertools
+import json
+import os
+import threading
+import time
 
 import numpy as np
-import skfuzzy as fuzz
-from skfuzzy import control as ctrl
+
+# -----------------------------------------------------------------
+# PART 0: นิยามตัวแปรและ Membership Functions
+# (ใช้ร่วมกันทั้ง skfuzzy path และ batch path)
+# -----------------------------------------------------------------
+
+# ขอบเขตของแต่ละ Input: (min, max, step)
+INPUT_UNIVERSES = {
+    'age': (18, 80, 1),
+    'income': (15000, 500000, 1000),
+    'time_horizon': (1, 30, 1),
+    'risk_tolerance': (1, 10, 1),
+}
+
+# Membership functions ของแต่ละ Input: label -> (ชนิด, breakpoints)
+INPUT_TERMS = {
+    'age': {
+        'young': ('trapmf', [18, 18, 30, 35]),
+        'middle_aged': ('trimf', [30, 45, 55]),
+        'senior': ('trapmf', [50, 60, 80, 80]),
+    },
+    'income': {
+        'low': ('trapmf', [15000, 15000, 40000, 60000]),
+        'medium': ('trimf', [45000, 80000, 120000]),
+        'high': ('trapmf', [100000, 150000, 500000, 500000]),
+    },
+    'time_horizon': {
+        'short': ('trapmf', [1, 1, 3, 5]),
+        'medium': ('trimf', [3, 7, 12]),
+        'long': ('trapmf', [10, 15, 30, 30]),
+    },
+    'risk_tolerance': {
+        'low': ('trapmf', [1, 1, 3, 5]),
+        'medium': ('trimf', [3, 5, 7]),
+        'high': ('trapmf', [5, 7, 10, 10]),
+    },
+}
+
+# ลำดับคอลัมน์ของ Input/Output ใน batch API
+INPUT_NAMES = ('age', 'income', 'time_horizon', 'risk_tolerance')
+OUTPUT_NAMES = ('equity', 'bonds', 'cash')
+
+# Output ทุกตัวใช้ universe 0 - 100 (%) และ automf 3 ระดับ
+OUTPUT_UNIVERSE = (0, 100, 1)
+OUTPUT_TERM_NAMES = ('low', 'medium', 'high')
+
+# กฎ (Rules): (antecedent, {output: term})
+# antecedent เขียนแบบเดียวกับ skfuzzy: ตัวแปร[term] เชื่อมด้วย & (AND), | (OR), ~ (NOT)
+# (เพิ่มสินทรัพย์ใหม่ได้โดยเพิ่มชื่อใน OUTPUT_NAMES และใส่ term ของสินทรัพย์นั้นในกฎ)
+RULES = (
+    # กฎที่ 1: Aggressive (เสี่ยงสูง)
+    # IF Risk=High AND (Age=Young OR Time=Long) THEN Equity=High, Bonds=Low, Cash=Low
+    ("risk_tolerance[high] & (age[young] | time_horizon[long])",
+     {'equity': 'high', 'bonds': 'low', 'cash': 'low'}),
+
+    # กฎที่ 2: Conservative (ปลอดภัย)
+    # IF Risk=Low OR Age=Senior THEN Equity=Low, Bonds=High, Cash=Medium
+    ("risk_tolerance[low] | age[senior] | time_horizon[short]",
+     {'equity': 'low', 'bonds': 'high', 'cash': 'medium'}),
+
+    # กฎที่ 3: Balanced (สมดุล)
+    # IF Risk=Medium AND Time=Medium AND Income=Medium THEN Equity=Medium, Bonds=Medium, Cash=Low
+    ("risk_tolerance[medium] & time_horizon[medium] & income[medium]",
+     {'equity': 'medium', 'bonds': 'medium', 'cash': 'low'}),
+
+    # กฎที่ 4: Wealthy Conservative (มีรายได้สูง แต่รับความเสี่ยงได้น้อย)
+    ("income[high] & risk_tolerance[low]",
+     {'equity': 'low', 'bonds': 'medium', 'cash': 'high'}),
+)
+
+# ชื่อของกฎแต่ละข้อใน RULES (ใช้ใน trace ของ calculate_portfolio_batch)
+RULE_NAMES = ('aggressive', 'conservative', 'balanced', 'wealthy_conservative')
+
+# จำนวนแถวที่ประมวลผลต่อรอบใน batch path (จำกัดขนาด array ชั่วคราว)
+BATCH_CHUNK_SIZE = 8192
+
+
+def _input_universe(name, spec=None):
+    lo, hi, step = INPUT_UNIVERSES[name] if spec is None else spec['inputs'][name]['universe']
+    return np.arange(lo, hi + step, step)
+
+
+def _output_universe(spec=None):
+    lo, hi, step = OUTPUT_UNIVERSE if spec is None else spec['output_universe']
+    return np.arange(lo, hi + step, step)
+
+
+@functools.lru_cache(maxsize=None)
+def _skfuzzy_control():
+    """import skfuzzy.control เมื่อต้องใช้ครั้งแรก (ช้า: โหลด SciPy และ NetworkX ด้วย)"""
+    from skfuzzy import control
+    return control
+
+
+def _make_antecedent(name, membership=None, spec=None, universe=None):
+    """
+    สร้าง ctrl.Antecedent พร้อม Membership functions จาก INPUT_TERMS (หรือจาก spec ถ้าระบุ)
+    (หรือจาก array ที่ compile ไว้แล้วใน membership ถ้ามี)
+    universe: จุดของ universe ที่ใช้แทนค่าจาก step (ดู resolution_universes)
+    """
+    if membership is not None:
+        var = _skfuzzy_control().Antecedent(membership[f'universe/{name}'], name)
+        for label, mf in zip(INPUT_TERMS[name], membership[f'input_mf/{name}']):
+            var[label] = mf
+        return var
+
+    import skfuzzy as fuzz
+
+    terms = INPUT_TERMS[name] if spec is None else spec['inputs'][name]['terms']
+    if universe is None:
+        universe = _input_universe(name, spec)
+    var = _skfuzzy_control().Antecedent(universe, name)
+    for label, (kind, params) in terms.items():
+        var[label] = getattr(fuzz, kind)(var.universe, params)
+    return var
+
+
+def _parse_antecedent(text, terms=None):
+    """
+    แปลง antecedent ของกฎ (string) เป็น tree:
+    ('term', ตัวแปร, label) / ('and', a, b) / ('or', a, b) / ('not', a)
+    terms: {ตัวแปร: {label: ...}} ที่ใช้ตรวจชื่อ term (ค่าเริ่มต้น: INPUT_TERMS)
+    """
+    terms = INPUT_TERMS if terms is None else terms
+
+    def visit(node):
+        if isinstance(node, ast.BinOp) and isinstance(node.op, (ast.BitAnd, ast.BitOr)):
+            kind = 'and' if isinstance(node.op, ast.BitAnd) else 'or'
+            return (kind, visit(node.left), visit(node.right))
+        if isinstance(node, ast.UnaryOp) and isinstance(node.op, ast.Invert):
+            return ('not', visit(node.operand))
+        if (isinstance(node, ast.Subscript) and isinstance(node.value, ast.Name)
+                and isinstance(node.slice, ast.Name)):
+            var, label = node.value.id, node.slice.id
+            if label not in terms.get(var, {}):
+                raise ValueError(f"Unknown term '{var}[{label}]' in rule: {text}")
+            return ('term', var, label)
+        raise ValueError(f"Unsupported syntax in rule: {text}")
+
+    try:
+        tree = ast.parse(text, mode='eval')
+    except SyntaxError as e:
+        raise ValueError(f"Unsupported syntax in rule: {text}") from e
+    return visit(tree.body)
+
+
+def _antecedent_to_ctrl(tree, variables):
+    """แปลง tree จาก _parse_antecedent เป็น expression ของ skfuzzy"""
+    kind = tree[0]
+    if kind == 'term':
+        return variables[tree[1]][tree[2]]
+    if kind == 'not':
+        return ~_antecedent_to_ctrl(tree[1], variables)
+    left = _antecedent_to_ctrl(tree[1], variables)
+    right = _antecedent_to_ctrl(tree[2], variables)
+    return left & right if kind == 'and' else left | right
+
+
+def _make_consequent(name, membership=None, spec=None, universe=None):
+    """สร้าง ctrl.Consequent พร้อม automf 3 ระดับ (หรือจาก array ที่ compile ไว้แล้ว)"""
+    if membership is not None:
+        var = _skfuzzy_control().Consequent(membership['universe/output'], name)
+        for label, mf in zip(OUTPUT_TERM_NAMES, membership['output_mf']):
+            var[label] = mf
+        return var
+
+    var = _skfuzzy_control().Consequent(_output_universe(spec) if universe is None else universe, name)
+    var.automf(names=list(OUTPUT_TERM_NAMES if spec is None else spec['output_terms']))
+    return var
+
+
+def _automf_breakpoints(lo, hi, number):
+    """
+    Breakpoints [a, b, c] ของ trimf ที่ automf สร้างให้ term จำนวน number
+    บน universe [lo, hi] (สูตรเดียวกับ FuzzyVariable.automf ของ skfuzzy)
+    """
+    width = (hi - lo) / ((number - 1) / 2.)
+    return [[c - width / 2, c, c + width / 2] for c in np.linspace(lo, hi, number)]
+
+
+@functools.lru_cache(maxsize=None)
+def _output_breakpoints():
+    """Breakpoints ของ trimf ที่ automf สร้างให้ Output แต่ละระดับ: {label: [a, b, c]}"""
+    universe = _output_universe()
+    return dict(zip(OUTPUT_TERM_NAMES,
+                    _automf_breakpoints(universe[0], universe[-1], len(OUTPUT_TERM_NAMES))))
+
+
+# --- Membership functions แบบ vectorized (ให้ผลเท่ากับ skfuzzy ภายใน universe) ---
+
+@functools.lru_cache(maxsize=None)
+def _trap_points(a, b, c, d):
+    """จุดหักมุมของ trapezoid (ตัดจุดซ้ำของขาแนวตั้งออก เช่น [18, 18, 30, 35])"""
+    xp, fp = [b, c], [1., 1.]
+    if a < b:
+        xp.insert(0, a)
+        fp.insert(0, 0.)
+    if d > c:
+        xp.append(d)
+        fp.append(0.)
+    return np.array(xp, dtype=float), np.array(fp)
+
+
+def _trapmf(x, abcd):
+    xp, fp = _trap_points(*abcd)
+    return np.interp(x, xp, fp, left=0., right=0.)
+
+
+def _trimf(x, abc):
+    a, b, c = abc
+    return _trapmf(x, (a, b, b, c))
+
+
+_MEMBERSHIP_FUNCS = {'trapmf': _trapmf, 'trimf': _trimf}
+
+
+def _trimf_kernel(x, abc):
+    """trimf แบบคำนวณตรงที่คง dtype ของ x (float32 / float64) ใช้ใน Defuzzify ของ fused kernel"""
+    a, b, c = abc
+    rise = (x - a) / (b - a) if b > a else (x >= a).astype(x.dtype)
+    fall = (c - x) / (c - b) if c > b else (x <= c).astype(x.dtype)
+    return np.clip(np.minimum(rise, fall), 0., 1.)
+
+# จำนวน breakpoints ของ Membership function แต่ละชนิด
+_MEMBERSHIP_ARITY = {'trapmf': 4, 'trimf': 3}
+
+
+def _trap_degrees(x, points):
+    """
+    membership ของ trapezoid หลายตัวพร้อมกัน: x (N, K) กับ breakpoints points (K, 4) -> (N, K)
+    ขาแนวตั้ง (เช่น a == b) -> เต็ม 1 ตั้งแต่จุดนั้น (เหมือน skfuzzy.trapmf)
+    """
+    a, b, c, d = points.T
+    with np.errstate(divide='ignore', invalid='ignore'):
+        rise = np.where(b > a, (x - a) / (b - a), x >= a)
+        fall = np.where(d > c, (d - x) / (d - c), x <= d)
+    return np.clip(np.minimum(rise, fall), 0., 1.)
+
+
+def _antecedent_clauses(tree):
+    """
+    แปลง tree จาก _parse_antecedent เป็นรูป OR ของ AND (DNF): list ของ clause
+    แต่ละ clause เป็น tuple ของ literal (ตัวแปร, label, negated)
+    ผลเท่ากับ tree เดิมทุกค่า เพราะ min/max กระจายกันได้ และ NOT (1 - x)
+    สลับ min กับ max ตาม De Morgan
+    """
+    def visit(node, negated):
+        kind = node[0]
+        if kind == 'term':
+            return [((node[1], node[2], negated),)]
+        if kind == 'not':
+            return visit(node[1], not negated)
+        left, right = visit(node[1], negated), visit(node[2], negated)
+        if (kind == 'and') != negated:
+            return [a + b for a in left for b in right]
+        return left + right
+
+    return visit(tree, False)
+
+
+def _polyline_centroid(x, y):
+    """
+    Centroid ของพื้นที่ใต้เส้น piecewise-linear (x, y) ทีละแถว
+    (วิธีเดียวกับ skfuzzy.defuzzify.centroid) คืน (moment, area)
+    """
+    x1, x2 = x[..., :-1], x[..., 1:]
+    y1, y2 = y[..., :-1], y[..., 1:]
+    dx = x2 - x1
+    area = 0.5 * dx * (y1 + y2)
+    moment = dx / 6. * (y1 * (2 * x1 + x2) + y2 * (x1 + 2 * x2))
+    return moment.sum(axis=-1), area.sum(axis=-1)
+
+
+def _kink_points(breakpoints, lo, hi):
+    """
+    จุดหักมุมคงที่ของ Output shape: breakpoints ของทุก term และจุดตัดระหว่าง
+    ขาของ term ต่าง ๆ (ไม่ขึ้นกับ firing strength) ที่อยู่ภายใน universe
+    """
+    points = {float(lo), float(hi)}
+    sides = []
+    for a, b, c in breakpoints:
+        points.update((a, b, c))
+        if b > a:
+            sides.append((1. / (b - a), -a / (b - a)))   # ขาขึ้น: y = (x - a) / (b - a)
+        if c > b:
+            sides.append((-1. / (c - b), c / (c - b)))   # ขาลง: y = (c - x) / (c - b)
+    for (m1, k1), (m2, k2) in itertools.combinations(sides, 2):
+        if m1 != m2:
+            points.add((k2 - k1) / (m1 - m2))
+    return np.array(sorted(x for x in points if lo <= x <= hi))
+
+
+def _defuzz_universe_batch(cuts, rulebase):
+    """
+    Defuzzify แบบ centroid บนจุดของ universe Output (0 - 100) จาก cut (N, O, T)
+    คืนค่า raw (ยังไม่ normalize) เป็น array (N, O); Output ที่ไม่มีกฎใด fire ได้ 0
+    """
+    universe = rulebase.output_universe
+    aggregated = np.zeros(cuts.shape[:2] + universe.shape)
+    for t, abc in enumerate(rulebase.output_points):
+        mf = _trimf_kernel(universe, abc)
+        np.fmax(aggregated, np.fmin(cuts[..., t, None], mf), out=aggregated)
+
+    moment, area = _polyline_centroid(universe, aggregated)
+    return np.divide(moment, area, out=np.zeros_like(area), where=area > 0)
+
+
+def _defuzz_analytic_batch(cuts, rulebase):
+    """
+    Defuzzify แบบ centroid ที่คำนวณจาก breakpoints ของ term โดยตรง (closed form)
+
+    Output shape = max ของ trimf ที่ถูก clip เป็นเส้น piecewise-linear ที่หักมุม
+    เฉพาะที่ breakpoints, จุดตัดระหว่างขาของ term และจุดที่ขาของ term ใดตัดกับ
+    ระดับ cut ของ term ใด ๆ จึงหาพื้นที่/moment ได้แม่นยำจากจุดเหล่านี้ (~25 จุด)
+    ไม่ขึ้นกับความละเอียดของ universe; รับ cut (N, O, T) คืนค่า raw (N, O)
+    """
+    lo, hi = rulebase.output_universe[0], rulebase.output_universe[-1]
+    breakpoints = rulebase.output_points
+    fixed = rulebase.kink_points
+
+    # จุดที่ขาของแต่ละ term มีค่าเท่ากับระดับ cut ของ term ใด ๆ
+    crossings = []
+    for a, b, c in breakpoints:
+        crossings.append(a + cuts * (b - a))
+        crossings.append(c - cuts * (c - b))
+    crossings.append(np.broadcast_to(fixed, cuts.shape[:2] + fixed.shape))
+    x = np.sort(np.clip(np.concatenate(crossings, axis=-1), lo, hi), axis=-1)
+
+    y = np.zeros_like(x)
+    for t, abc in enumerate(breakpoints):
+        np.fmax(y, np.fmin(cuts[..., t, None], _trimf_kernel(x, abc)), out=y)
+
+    moment, area = _polyline_centroid(x, y)
+    return np.divide(moment, area, out=np.zeros_like(area), where=area > 0)
+
+
+# วิธี Defuzzify ของ batch path
+#   'analytic' - closed form จาก breakpoints (ค่าเริ่มต้น)
+#   'universe' - centroid บนจุดของ universe 0 - 100 (คลาดเคลื่อนตามความละเอียด universe)
+DEFUZZ_METHODS = {
+    'analytic': _defuzz_analytic_batch,
+    'universe': _defuzz_universe_batch,
+}
+
+
+# -----------------------------------------------------------------
+# PART 0b: นิยามแบบ declarative (spec) และ Rule base ที่ compile แล้ว
+# -----------------------------------------------------------------
+#
+# spec (dict / ไฟล์ JSON หรือ YAML) มีข้อมูลชุดเดียวกับตารางใน PART 0:
+#   inputs:          {ตัวแปร: {universe: [min, max, step], terms: {label: [ชนิด, breakpoints]}}}
+#   outputs:         [สินทรัพย์, ...]  (ต้องมี 'cash' สำหรับ Default case)
+#   output_universe: [min, max, step]
+#   output_terms:    [label, ...]     (สร้างด้วย automf ตามลำดับ)
+#   rules:           [{if: antecedent, then: {สินทรัพย์: label}}, ...]
+# ตัวแปร Input ต้องตรงกับ INPUT_NAMES (ตามลำดับ argument ของ calculate_portfolio)
+
+def default_spec():
+    """spec ของนิยามใน PART 0 (ใช้เป็นต้นแบบไฟล์ spec ได้: json.dump(default_spec(), f))"""
+    return {
+        'inputs': {
+            name: {
+                'universe': list(INPUT_UNIVERSES[name]),
+                'terms': {label: [kind, list(params)] for label, (kind, params) in INPUT_TERMS[name].items()},
+            }
+            for name in INPUT_NAMES
+        },
+        'outputs': list(OUTPUT_NAMES),
+        'output_universe': list(OUTPUT_UNIVERSE),
+        'output_terms': list(OUTPUT_TERM_NAMES),
+        'rules': [{'name': name, 'if': antecedent, 'then': dict(consequents)}
+                  for name, (antecedent, consequents) in zip(RULE_NAMES, RULES)],
+    }
+
+
+def load_spec(path):
+    """อ่าน spec จากไฟล์ .json หรือ .yaml / .yml แล้วตรวจความถูกต้อง"""
+    with open(path, encoding='utf-8') as f:
+        if str(path).lower().endswith(('.yaml', '.yml')):
+            try:
+                import yaml
+            except ImportError:
+                raise ImportError("Reading YAML specs requires PyYAML: pip install pyyaml")
+            spec = yaml.safe_load(f)
+        else:
+            spec = json.load(f)
+    validate_spec(spec)
+    return spec
+
+
+def validate_spec(spec):
+    """ตรวจโครงสร้างของ spec (แจ้ง ValueError พร้อมตำแหน่งที่ผิด)"""
+    try:
+        inputs = spec['inputs']
+        if sorted(inputs) != sorted(INPUT_NAMES):
+            raise ValueError(f"Spec inputs must be exactly {INPUT_NAMES}.")
+        for name, variable in inputs.items():
+            lo, hi, step = variable['universe']
+            if not lo < hi or step <= 0:
+                raise ValueError(f"Invalid universe for '{name}': {variable['universe']}")
+            if not variable['terms']:
+                raise ValueError(f"Input '{name}' has no terms.")
+            for label, (kind, params) in variable['terms'].items():
+                if kind not in _MEMBERSHIP_ARITY:
+                    raise ValueError(f"Unknown membership function '{kind}' for '{name}[{label}]'; "
+                                     f"expected one of {list(_MEMBERSHIP_ARITY)}.")
+                if len(params) != _MEMBERSHIP_ARITY[kind] or list(params) != sorted(params):
+                    raise ValueError(f"Invalid breakpoints for '{name}[{label}]': {params}")
+
+        outputs, output_terms = spec['outputs'], spec['output_terms']
+        if 'cash' not in outputs:
+            raise ValueError("Spec outputs must include 'cash' (used by the default case).")
+        if len(output_terms) < 2:
+            raise ValueError("Spec needs at least 2 output_terms.")
+        lo, hi, step = spec['output_universe']
+        if not lo < hi or step <= 0:
+            raise ValueError(f"Invalid output_universe: {spec['output_universe']}")
+
+        if not spec['rules']:
+            raise ValueError("Spec has no rules.")
+        names = [rule['name'] for rule in spec['rules'] if 'name' in rule]
+        if len(set(names)) != len(names):
+            raise ValueError(f"Rule names must be unique: {names}")
+        terms = {name: variable['terms'] for name, variable in inputs.items()}
+        for rule in spec['rules']:
+            _parse_antecedent(rule['if'], terms)
+            for output, label in rule['then'].items():
+                if output not in outputs or label not in output_terms:
+                    raise ValueError(f"Unknown consequent '{output}[{label}]' in rule: {rule['if']}")
+    except (KeyError, TypeError) as e:
+        raise ValueError(f"Malformed spec: {e!r}") from e
+
+
+def spec_fingerprint(spec):
+    """Hash ของ spec (ใช้เป็นชื่อไฟล์ cache ของ rule base ที่ compile แล้ว)"""
+    payload = json.dumps(spec, sort_keys=True).encode('utf-8')
+    return hashlib.sha256(payload).hexdigest()[:16]
+
+
+def definitions_fingerprint():
+    """
+    spec_fingerprint ของนิยามใน PART 0 (เท่ากับ default_rulebase().fingerprint)
+    ใช้เป็น version ของข้อมูลที่คำนวณล่วงหน้า (เปลี่ยนนิยาม -> hash เปลี่ยน)
+    """
+    return spec_fingerprint(default_spec())
+
+
+@contextlib.contextmanager
+def _atomic_write(path):
+    """
+    เปิดไฟล์ชั่วคราว (binary) ข้าง path ให้เขียน แล้ว rename ทับ path เมื่อเขียนเสร็จ
+    process อื่นที่กำลังอ่านไฟล์เดิมอยู่จึงไม่เห็นไฟล์ที่เขียนไม่เสร็จ (เขียนไม่สำเร็จ -> ลบไฟล์ชั่วคราว)
+    """
+    tmp_path = f"{path}.tmp-{os.getpid()}"
+    try:
+        with open(tmp_path, 'wb') as f:
+            yield f
+        os.replace(tmp_path, path)
+    except BaseException:
+        with contextlib.suppress(OSError):
+            os.remove(tmp_path)
+        raise
+
+
+class CompiledRuleBase:
+    """
+    Rule base ที่ compile จาก spec เป็น array แบบ flat สำหรับ fused kernel
+    (K = จำนวน term ของ Input ทั้งหมด, C = จำนวน clause, R = กฎ, O = Output, T = term ของ Output)
+
+    term_var (K,)           index ของตัวแปร Input (ตาม INPUT_NAMES) ของแต่ละ term
+    term_points (K, 4)      breakpoints แบบ trapezoid [a, b, c, d] (trimf -> [a, b, b, c])
+    clause_literals (C, L)  index ของ literal ที่ AND กันใน clause: 0..K-1 = term,
+                            K..2K-1 = NOT term, 2K = ค่าคงที่ 1 (เติมให้ทุก clause ยาวเท่ากัน)
+    rule_clauses (R,)       index ของ clause แรกของแต่ละกฎ (clause ของกฎเดียวกัน OR กัน)
+    consequents (R, O)      index ของ term Output ที่กฎชี้ไป (-1 = ไม่มีผลกับ Output นั้น)
+    output_points (T, 3)    breakpoints ของ trimf ที่ automf สร้างให้ Output
+    """
+
+    ARRAY_NAMES = ('input_bounds', 'term_var', 'term_points', 'clause_literals', 'rule_clauses',
+                   'consequents', 'output_universe', 'output_points', 'kink_points')
+
+    def __init__(self, arrays, spec, fingerprint):
+        for key in self.ARRAY_NAMES:
+            setattr(self, key, arrays[key])
+        self.spec = spec
+        self.fingerprint = fingerprint
+        self.output_names = tuple(spec['outputs'])
+        self.term_labels = {name: tuple(spec['inputs'][name]['terms']) for name in INPUT_NAMES}
+        self.term_names = tuple(f'{name}[{label}]' for name in INPUT_NAMES for label in self.term_labels[name])
+        self.rule_names = tuple(rule.get('name', f'rule{r + 1}') for r, rule in enumerate(spec['rules']))
+        self.dtype = self.term_points.dtype
+        self.consequent_mask = np.zeros(self.consequents.shape + (len(spec['output_terms']),), dtype=self.dtype)
+        rules, outputs = np.nonzero(self.consequents >= 0)
+        self.consequent_mask[rules, outputs, self.consequents[rules, outputs]] = 1.
+        self._cash = self.output_names.index('cash')
+
+        # term ของแต่ละตัวแปรเรียงต่อกันตาม INPUT_NAMES -> ช่วง index ของ term ต่อตัวแปร
+        # และ clause ที่อ้างถึงตัวแปรนั้น (ใช้คำนวณใหม่เฉพาะส่วนที่เปลี่ยนใน AdvisorSession)
+        edges = np.searchsorted(self.term_var, np.arange(len(INPUT_NAMES) + 1))
+        literal_var = np.append(np.tile(self.term_var, 2), -1)[self.clause_literals]
+        self.term_slices = {name: slice(int(edges[v]), int(edges[v + 1])) for v, name in enumerate(INPUT_NAMES)}
+        self.variable_clauses = {name: np.flatnonzero((literal_var == v).any(axis=1))
+                                 for v, name in enumerate(INPUT_NAMES)}
+
+    @classmethod
+    def compile(cls, spec):
+        validate_spec(spec)
+        term_var, term_points, term_index = [], [], {}
+        for v, name in enumerate(INPUT_NAMES):
+            for label, (kind, params) in spec['inputs'][name]['terms'].items():
+                term_index[name, label] = len(term_points)
+                term_var.append(v)
+                term_points.append(params if kind == 'trapmf' else [params[0], params[1], params[1], params[2]])
+        k = len(term_points)
+
+        terms = {name: spec['inputs'][name]['terms'] for name in INPUT_NAMES}
+        clauses, rule_clauses = [], []
+        for rule in spec['rules']:
+            rule_clauses.append(len(clauses))
+            for clause in _antecedent_clauses(_parse_antecedent(rule['if'], terms)):
+                clauses.append([term_index[name, label] + (k if negated else 0)
+                                for name, label, negated in clause])
+        clause_literals = np.full((len(clauses), max(map(len, clauses))), 2 * k, dtype=np.intp)
+        for c, literals in enumerate(clauses):
+            clause_literals[c, :len(literals)] = literals
+
+        outputs, output_terms = spec['outputs'], spec['output_terms']
+        consequents = np.array(
+            [[output_terms.index(rule['then'][name]) if name in rule['then'] else -1 for name in outputs]
+             for rule in spec['rules']],
+            dtype=np.int8)
+
+        universe = _output_universe(spec).astype(float)
+        output_points = np.array(_automf_breakpoints(universe[0], universe[-1], len(output_terms)))
+        arrays = {
+            'input_bounds': np.array([spec['inputs'][name]['universe'][:2] for name in INPUT_NAMES], dtype=float),
+            'term_var': np.array(term_var, dtype=np.intp),
+            'term_points': np.array(term_points, dtype=float),
+            'clause_literals': clause_literals,
+            'rule_clauses': np.array(rule_clauses, dtype=np.intp),
+            'consequents': consequents,
+            'output_universe': universe,
+            'output_points': output_points,
+            'kink_points': _kink_points(output_points.tolist(), universe[0], universe[-1]),
+        }
+        return cls(arrays, spec, spec_fingerprint(spec))
+
+    def save(self, path):
+        """บันทึกเป็นไฟล์ .npz (ผ่าน _atomic_write)"""
+        meta = json.dumps({'spec': self.spec, 'fingerprint': self.fingerprint})
+        with _atomic_write(path) as f:
+            np.savez(f, meta=np.array(meta), **{key: getattr(self, key) for key in self.ARRAY_NAMES})
+
+    def variant(self, dtype=None, output_universe=None):
+        """
+        สำเนาที่ใช้ array ชุดเดิม แต่เปลี่ยนความละเอียดของการคำนวณ
+        dtype:           ชนิดของ array ทศนิยมทั้งหมด (เช่น np.float32) -> kernel คำนวณด้วย dtype นี้
+        output_universe: จุดของ universe Output ที่ใช้กับ defuzz='universe'
+        """
+        arrays = {key: getattr(self, key) for key in self.ARRAY_NAMES}
+        if output_universe is not None:
+            arrays['output_universe'] = np.asarray(output_universe, dtype=float)
+        if dtype is not None:
+            arrays = {key: arr.astype(dtype) if arr.dtype.kind == 'f' else arr for key, arr in arrays.items()}
+        return CompiledRuleBase(arrays, self.spec, self.fingerprint)
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as data:
+            meta = json.loads(str(data['meta']))
+            arrays = {key: data[key] for key in cls.ARRAY_NAMES}
+        return cls(arrays, meta['spec'], meta['fingerprint'])
+
+    # --- Fused kernel: fuzzify -> firing strength -> term cut -> defuzzify -> normalize ---
+
+    def fuzzify(self, inputs):
+        """membership degree ของทุก term พร้อมกัน -> array (N, K)"""
+        x = np.stack([inputs[name] for name in INPUT_NAMES], axis=1)[:, self.term_var]
+        return _trap_degrees(x, self.term_points)
+
+    def fire(self, mu):
+        """Firing strength ของทุกกฎ: clause = min ของ literal, กฎ = max ของ clause -> (N, R)"""
+        literals = np.concatenate([mu, 1. - mu, np.ones((mu.shape[0], 1), dtype=mu.dtype)], axis=1)
+        clauses = literals[:, self.clause_literals].min(axis=2)
+        return np.maximum.reduceat(clauses, self.rule_clauses, axis=1)
+
+    def term_cuts(self, strengths):
+        """
+        Accumulation (max) ของ firing strength ทุกกฎที่ชี้มาที่ term เดียวกัน
+        ทำพร้อมกันทุก Output ในรอบเดียว -> ระดับ cut array (N, O, T)
+        """
+        return (strengths[:, :, None, None] * self.consequent_mask[None]).max(axis=1)
+
+    def normalize(self, raw):
+        """Normalize ให้แต่ละแถวรวมเป็น 100% (แถวที่รวมได้ 0 -> เงินฝาก 100%)"""
+        total = raw.sum(axis=1, keepdims=True)
+        out = np.zeros_like(raw)
+        out[:, self._cash] = 100.
+        np.divide(raw * 100., total, out=out, where=total > 0)
+        return out
+
+
+@functools.lru_cache(maxsize=None)
+def default_rulebase():
+    """Rule base ที่ compile จากนิยามใน PART 0 (compile ครั้งเดียวต่อ process)"""
+    return CompiledRuleBase.compile(default_spec())
+
+
+def compile_spec(spec=None, cache_dir=None):
+    """
+    Compile spec (dict, path ของไฟล์ JSON/YAML หรือ None = นิยามใน PART 0) เป็น CompiledRuleBase
+    cache_dir: โฟลเดอร์เก็บผล compile เป็น <spec_fingerprint>.npz แล้วโหลดซ้ำเมื่อ spec ไม่เปลี่ยน
+    """
+    if spec is None:
+        spec = default_spec()
+    elif not isinstance(spec, dict):
+        spec = load_spec(spec)
+    if cache_dir is None:
+        return CompiledRuleBase.compile(spec)
+
+    path = os.path.join(cache_dir, f'{spec_fingerprint(spec)}.npz')
+    if os.path.exists(path):
+        return CompiledRuleBase.load(path)
+    rulebase = CompiledRuleBase.compile(spec)
+    os.makedirs(cache_dir, exist_ok=True)
+    rulebase.save(path)
+    return rulebase
+
+
+# ความแม่นยำของ fused kernel / batch path: ชื่อ -> dtype
+PRECISIONS = {'float64': np.float64, 'float32': np.float32}
+
+# ระยะห่างของจุดเสริมใน universe Output แบบ 'adaptive' (ดู resolution_universes)
+ADAPTIVE_OUTPUT_STEP = 5.
+
+
+def resolution_universes(resolution, rulebase=None):
+    """
+    แปลง resolution {ตัวแปร Input หรือ 'output': ค่า} เป็น {ชื่อ: จุดของ universe}
+      step (ตัวเลข) - จุดห่างเท่ากันตาม step (ปลายทั้งสองตรงกับขอบเขตเดิมเสมอ)
+      'adaptive'    - Input: ขอบเขต + breakpoints ของทุก term (membership เป็นเส้นตรง
+                      ระหว่างจุดเหล่านี้ จึงไม่คลาดเคลื่อน); Output: kink_points + จุดห่าง
+                      ทุก ADAPTIVE_OUTPUT_STEP
+    """
+    rulebase = default_rulebase() if rulebase is None else rulebase
+    unknown = sorted(set(resolution) - set(INPUT_NAMES + ('output',)))
+    if unknown:
+        raise ValueError(f"Unknown resolution keys {unknown}; expected names from {INPUT_NAMES} or 'output'.")
+
+    universes = {}
+    for name, value in resolution.items():
+        if name == 'output':
+            lo, hi = float(rulebase.output_universe[0]), float(rulebase.output_universe[-1])
+            fixed = rulebase.kink_points.astype(float)
+        else:
+            lo, hi = rulebase.input_bounds[INPUT_NAMES.index(name)].astype(float)
+            fixed = rulebase.term_points[rulebase.term_slices[name]].astype(float).ravel()
+        if value == 'adaptive':
+            points = fixed if name != 'output' else np.append(fixed, np.arange(lo, hi, ADAPTIVE_OUTPUT_STEP))
+        elif isinstance(value, (int, float)) and value > 0:
+            points = np.arange(lo, hi, float(value))
+        else:
+            raise ValueError(f"Resolution of '{name}' must be a positive step or 'adaptive', got {value!r}.")
+        universes[name] = np.unique(np.clip(np.append(points, [lo, hi]), lo, hi))
+    return universes
+
+
+# -----------------------------------------------------------------
+# PART 1a: Profiling ราย stage ของ pipeline (ตัวเลือก)
+# -----------------------------------------------------------------
+
+class StageProfiler:
+    """
+    เก็บเวลา (wall time) และจำนวนครั้งของแต่ละ stage ใน pipeline การคำนวณ
+
+    stage ของ fused/batch path: input, fuzzify, rules, aggregate, defuzzify, normalize
+    stage ของ skfuzzy path:     input, inference (ControlSystemSimulation.compute()
+                                ทั้งก้อน แยกย่อยไม่ได้), normalize
+
+    callback(stage, seconds) ถูกเรียกทุกครั้งที่ stage จบ (เช่นส่งต่อให้ระบบ tracing)
+    """
+
+    def __init__(self, callback=None):
+        self.callback = callback
+        self._lock = threading.Lock()
+        self._calls = collections.Counter()
+        self._seconds = collections.Counter()
+
+    @contextlib.contextmanager
+    def stage(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - start
+            with self._lock:
+                self._calls[name] += 1
+                self._seconds[name] += elapsed
+            if self.callback is not None:
+                self.callback(name, elapsed)
+
+    def report(self):
+        """{stage: {'calls', 'total_seconds', 'mean_us', 'share'}} เรียงตามเวลารวมมากไปน้อย"""
+        with self._lock:
+            total = sum(self._seconds.values())
+            return {
+                name: {
+                    'calls': self._calls[name],
+                    'total_seconds': seconds,
+                    'mean_us': seconds / self._calls[name] * 1e6,
+                    'share': seconds / total if total else 0.,
+                }
+                for name, seconds in self._seconds.most_common()
+            }
+
+    def reset(self):
+        with self._lock:
+            self._calls.clear()
+            self._seconds.clear()
+
+
+# ใช้แทน profiler.stage() เมื่อไม่ได้เปิด profiling (ไม่มีการจับเวลาเลย)
+_NO_STAGE = contextlib.nullcontext()
+
+
+def _stage(profiler, name):
+    return _NO_STAGE if profiler is None else profiler.stage(name)
+
+
+def _prepare_batch_inputs(user_age, user_income=None, user_time=None, user_risk=None, rulebase=None):
+    """
+    แปลง Input ของ batch API เป็น {ตัวแปร: array 1 มิติ} ที่ clip อยู่ใน universe แล้ว
+    (รับ array ทั้ง 4 ตัว หรือ DataFrame / dict ที่มีคอลัมน์ตาม INPUT_NAMES)
+    rulebase: ใช้ universe ของ CompiledRuleBase นี้แทน INPUT_UNIVERSES
+    Input ที่เป็น NaN / infinity -> ValueError (ทุก backend ผ่านจุดนี้จุดเดียว)
+    """
+    if user_income is None and user_time is None and user_risk is None:
+        columns = [user_age[name] for name in INPUT_NAMES]
+    else:
+        columns = [user_age, user_income, user_time, user_risk]
+
+    columns = [np.atleast_1d(np.asarray(col, dtype=float)) for col in columns]
+    n = columns[0].shape[0]
+    if any(col.ndim != 1 or col.shape[0] != n for col in columns):
+        raise ValueError("Inputs must be 1-D arrays of the same length.")
+    # NaN ผ่าน np.clip ไปได้ และแต่ละ kernel ให้ผลต่างกัน (NumPy: เงินฝาก 100%, Numba: min/max
+    # แบบ scalar ข้าม NaN) จึงปฏิเสธตั้งแต่ตรงนี้แทนการให้ผลที่ไม่มีความหมาย
+    invalid = [name for name, col in zip(INPUT_NAMES, columns) if not np.isfinite(col).all()]
+    if invalid:
+        raise ValueError(f"Inputs must be finite numbers; got NaN or infinity in {invalid}.")
+
+    # Clip ให้อยู่ในขอบเขต universe เหมือน ControlSystemSimulation
+    bounds = default_rulebase().input_bounds if rulebase is None else rulebase.input_bounds
+    return {name: np.clip(col, lo, hi) for name, col, (lo, hi) in zip(INPUT_NAMES, columns, bounds)}
+
+
+def _new_trace(rulebase, n):
+    """
+    array ว่างของ trace (คำอธิบายผลลัพธ์ต่อแถว) สำหรับ n แถว:
+      'memberships'     (N, K)    membership degree ของทุก term ตาม 'term_names' เช่น 'age[young]'
+      'rule_strengths'  (N, R)    firing strength ของทุกกฎตาม 'rule_names'
+      'term_cuts'       (N, O, T) ระดับ cut ของแต่ละ term Output (max ของกฎที่ชี้มา) ตาม
+                                  'output_names' x 'output_terms'
+    """
+    k, r = rulebase.term_var.size, rulebase.rule_clauses.size
+    o, t = rulebase.consequent_mask.shape[1:]
+    return {
+        'term_names': rulebase.term_names,
+        'rule_names': rulebase.rule_names,
+        'output_names': rulebase.output_names,
+        'output_terms': tuple(rulebase.spec['output_terms']),
+        'memberships': np.empty((n, k), dtype=rulebase.dtype),
+        'rule_strengths': np.empty((n, r), dtype=rulebase.dtype),
+        'term_cuts': np.empty((n, o, t), dtype=rulebase.dtype),
+    }
+
+
+def _evaluate_batch(inputs, defuzz='analytic', profiler=None, rulebase=None, trace=None):
+    """
+    ประมวลผล Fuzzy แบบ vectorized ด้วย fused kernel ของ CompiledRuleBase
+    (ค่าเริ่มต้น: default_rulebase()) ทีละ BATCH_CHUNK_SIZE แถว -> array (N, O)
+    trace: dict จาก _new_trace -> เก็บค่าระหว่างทางของทุกแถวไว้ด้วย (None = ไม่เก็บ)
+    """
+    rulebase = default_rulebase() if rulebase is None else rulebase
+    defuzzify = DEFUZZ_METHODS[defuzz]
+    n = inputs[INPUT_NAMES[0]].shape[0]
+    results = np.empty((n, len(rulebase.output_names)), dtype=rulebase.dtype)
+    for start in range(0, n, BATCH_CHUNK_SIZE):
+        chunk = {name: values[start:start + BATCH_CHUNK_SIZE].astype(rulebase.dtype, copy=False)
+                 for name, values in inputs.items()}
+        # Fuzzify ครั้งเดียว -> firing strength ครั้งเดียว -> กระจายไปทุก Output
+        with _stage(profiler, 'fuzzify'):
+            mu = rulebase.fuzzify(chunk)
+        with _stage(profiler, 'rules'):
+            strengths = rulebase.fire(mu)
+        with _stage(profiler, 'aggregate'):
+            cuts = rulebase.term_cuts(strengths)
+        with _stage(profiler, 'defuzzify'):
+            raw = defuzzify(cuts, rulebase)
+        with _stage(profiler, 'normalize'):
+            results[start:start + BATCH_CHUNK_SIZE] = rulebase.normalize(raw)
+        if trace is not None:
+            rows = slice(start, start + BATCH_CHUNK_SIZE)
+            trace['memberships'][rows] = mu
+            trace['rule_strengths'][rows] = strengths
+            trace['term_cuts'][rows] = cuts
+    return results
+
+
+def _fused_rows(x, term_var, term_points, clause_literals, rule_clauses, consequents,
+                output_points, kink_points, lo, hi, cash, out):
+    """
+    fused kernel แบบ loop ทีละแถว (เขียนให้ Numba compile ได้; ดู _jit_kernel)
+    ทำทุกขั้นเหมือน _evaluate_batch กับ defuzz='analytic' แต่ใช้ buffer ขนาดเล็กชุดเดียว
+    แทน array ชั่วคราวขนาด (N, ...) ของทุกขั้น: x (N, 4) ตาม INPUT_NAMES -> out (N, O)
+    """
+    k = term_var.shape[0]
+    n_clauses, width = clause_literals.shape
+    n_rules = rule_clauses.shape[0]
+    n_outputs = consequents.shape[1]
+    n_terms = output_points.shape[0]
+    n_fixed = kink_points.shape[0]
+    literals = np.empty(2 * k + 1, dtype=x.dtype)
+    strengths = np.empty(n_rules, dtype=x.dtype)
+    cuts = np.empty(n_terms, dtype=x.dtype)
+    points = np.empty(n_fixed + 2 * n_terms * n_terms, dtype=x.dtype)
+    raw = np.empty(n_outputs, dtype=x.dtype)
+
+    for i in range(x.shape[0]):
+        # Fuzzify: membership ของทุก term (trapezoid; trimf ถูกเก็บเป็น [a, b, b, c])
+        for j in range(k):
+            v = x[i, term_var[j]]
+            a, b, c, d = term_points[j, 0], term_points[j, 1], term_points[j, 2], term_points[j, 3]
+            rise = (v - a) / (b - a) if b > a else (1. if v >= a else 0.)
+            fall = (d - v) / (d - c) if d > c else (1. if v <= d else 0.)
+            mu = min(max(min(rise, fall), 0.), 1.)
+            literals[j] = mu
+            literals[k + j] = 1. - mu
+        literals[2 * k] = 1.
+
+        # Rules: clause = min ของ literal, กฎ = max ของ clause
+        for r in range(n_rules):
+            stop = rule_clauses[r + 1] if r + 1 < n_rules else n_clauses
+            strength = 0.
+            for clause in range(rule_clauses[r], stop):
+                value = 1.
+                for m in range(width):
+                    value = min(value, literals[clause_literals[clause, m]])
+                strength = max(strength, value)
+            strengths[r] = strength
+
+        total = 0.
+        for o in range(n_outputs):
+            # Aggregate: ระดับ cut ของแต่ละ term = max ของกฎที่ชี้มา
+            for t in range(n_terms):
+                cuts[t] = 0.
+            for r in range(n_rules):
+                t = consequents[r, o]
+                if t >= 0 and strengths[r] > cuts[t]:
+                    cuts[t] = strengths[r]
+
+            # Defuzzify: centroid แบบ closed form (จุดหักมุมเดียวกับ _defuzz_analytic_batch)
+            m = 0
+            for p in range(n_fixed):
+                points[m] = kink_points[p]
+                m += 1
+            for t in range(n_terms):
+                a, b, c = output_points[t, 0], output_points[t, 1], output_points[t, 2]
+                for s in range(n_terms):
+                    # cut 0 / 1 ให้จุด a, c / b ซึ่งอยู่ใน kink_points แล้ว
+                    if 0. < cuts[s] < 1.:
+                        points[m] = min(max(a + cuts[s] * (b - a), lo), hi)
+                        points[m + 1] = min(max(c - cuts[s] * (c - b), lo), hi)
+                        m += 2
+            shape = np.sort(points[:m])
+
+            moment = 0.
+            area = 0.
+            x1 = 0.
+            y1 = 0.
+            for p in range(m):
+                x2 = shape[p]
+                y2 = 0.
+                for t in range(n_terms):
+                    a, b, c = output_points[t, 0], output_points[t, 1], output_points[t, 2]
+                    rise = (x2 - a) / (b - a) if b > a else (1. if x2 >= a else 0.)
+                    fall = (c - x2) / (c - b) if c > b else (1. if x2 <= c else 0.)
+                    y2 = max(y2, min(cuts[t], min(max(min(rise, fall), 0.), 1.)))
+                if p > 0:
+                    dx = x2 - x1
+                    area += 0.5 * dx * (y1 + y2)
+                    moment += dx / 6. * (y1 * (2 * x1 + x2) + y2 * (x1 + 2 * x2))
+                x1 = x2
+                y1 = y2
+            raw[o] = moment / area if area > 0 else 0.
+            total += raw[o]
+
+        # Normalize ให้รวมเป็น 100% (แถวที่รวมได้ 0 -> เงินฝาก 100%)
+        for o in range(n_outputs):
+            if total > 0:
+                out[i, o] = raw[o] * 100. / total
+            else:
+                out[i, o] = 100. if o == cash else 0.
+
+
+@functools.lru_cache(maxsize=None)
+def _jit_kernel():
+    """compile _fused_rows ด้วย Numba เมื่อใช้ครั้งแรก (None ถ้าไม่ได้ติดตั้ง Numba)"""
+    try:
+        import numba
+    except ImportError:
+        return None
+    return numba.njit(cache=True, nogil=True)(_fused_rows)
+
+
+def _evaluate_batch_jit(inputs, rulebase, kernel, profiler=None):
+    """เหมือน _evaluate_batch (defuzz='analytic') แต่คำนวณทั้งหมดใน kernel ที่ compile แล้ว"""
+    x = np.column_stack([inputs[name] for name in INPUT_NAMES]).astype(rulebase.dtype, copy=False)
+    results = np.empty((x.shape[0], len(rulebase.output_names)), dtype=rulebase.dtype)
+    lo, hi = rulebase.output_universe[0], rulebase.output_universe[-1]
+    with _stage(profiler, 'inference'):
+        kernel(x, rulebase.term_var, rulebase.term_points, rulebase.clause_literals, rulebase.rule_clauses,
+               rulebase.consequents, rulebase.output_points, rulebase.kink_points, lo, hi, rulebase._cash, results)
+    return results
+
+
+# -----------------------------------------------------------------
+# PART 1b: Compiled artifact (memory-mapped, ใช้ร่วมกันได้หลาย process)
+# -----------------------------------------------------------------
+
+# รูปแบบไฟล์: MAGIC | ความยาว header (8 byte) | header JSON | ข้อมูล array (aligned)
+ARTIFACT_MAGIC = b'FIAENG01'
+ARTIFACT_ALIGNMENT = 64
+
+
+def _align(offset):
+    return -(-offset // ARTIFACT_ALIGNMENT) * ARTIFACT_ALIGNMENT
+
+
+def compiled_arrays():
+    """
+    State ที่ compile แล้วของ engine ในรูป {ชื่อ: array}: universe และ membership
+    array ของทุกตัวแปร และ consequent ของกฎ (index ของ term)
+    """
+    arrays = {}
+    for name in INPUT_NAMES:
+        universe = _input_universe(name).astype(float)
+        arrays[f'universe/{name}'] = universe
+        arrays[f'input_mf/{name}'] = np.stack([
+            _MEMBERSHIP_FUNCS[kind](universe, params)
+            for kind, params in INPUT_TERMS[name].values()
+        ])
+
+    universe = _output_universe().astype(float)
+    arrays['universe/output'] = universe
+    arrays['output_mf'] = np.stack([_trimf(universe, abc)
+                                    for abc in _output_breakpoints().values()])
+    # index ของ term ที่กฎ r ชี้ไปใน Output o (-1 = กฎนี้ไม่มีผลกับ Output นั้น)
+    arrays['rules/consequents'] = np.array(
+        [[OUTPUT_TERM_NAMES.index(cons[name]) if name in cons else -1 for name in OUTPUT_NAMES]
+         for _, cons in RULES],
+        dtype=np.int8)
+    return arrays
+
+
+def save_artifact(path):
+    """เขียน state ที่ compile แล้วลงไฟล์เดียว (ผ่าน _atomic_write)"""
+    arrays = {key: np.ascontiguousarray(arr) for key, arr in compiled_arrays().items()}
+
+    layout = {}
+    offset = 0
+    for key, arr in arrays.items():
+        layout[key] = {'dtype': arr.dtype.str, 'shape': list(arr.shape), 'offset': offset}
+        offset = _align(offset + arr.nbytes)
+
+    header = json.dumps({
+        'version': definitions_fingerprint(),
+        'input_terms': {name: list(INPUT_TERMS[name]) for name in INPUT_NAMES},
+        'output_terms': list(OUTPUT_TERM_NAMES),
+        'outputs': list(OUTPUT_NAMES),
+        'rule_antecedents': [antecedent for antecedent, _ in RULES],
+        'arrays': layout,
+    }).encode('utf-8')
+    data_start = _align(len(ARTIFACT_MAGIC) + 8 + len(header))
+
+    with _atomic_write(path) as f:
+        f.write(ARTIFACT_MAGIC)
+        f.write(len(header).to_bytes(8, 'little'))
+        f.write(header)
+        for key, arr in arrays.items():
+            f.seek(data_start + layout[key]['offset'])
+            f.write(arr.tobytes())
+        f.truncate(data_start + offset)
+
+
+class EngineArtifact:
+    """
+    State ที่ compile แล้วของ engine โหลดจากไฟล์ของ save_artifact() แบบ
+    np.memmap read-only: ทุก process ที่เปิดไฟล์เดียวกันใช้ page cache ชุดเดียวกัน
+    """
+
+    def __init__(self, path):
+        with open(path, 'rb') as f:
+            if f.read(len(ARTIFACT_MAGIC)) != ARTIFACT_MAGIC:
+                raise ValueError(f"'{path}' is not a fuzzy engine artifact.")
+            header_len = int.from_bytes(f.read(8), 'little')
+            self.header = json.loads(f.read(header_len).decode('utf-8'))
+
+        self.path = path
+        self.version = self.header['version']
+        if self.version != definitions_fingerprint():
+            raise ValueError(f"Artifact '{path}' was compiled from different membership/rule "
+                             "definitions; rebuild it with save_artifact().")
+
+        data_start = _align(len(ARTIFACT_MAGIC) + 8 + header_len)
+        self.arrays = {
+            key: np.memmap(path, mode='r', dtype=np.dtype(spec['dtype']),
+                           shape=tuple(spec['shape']), offset=data_start + spec['offset'])
+            for key, spec in self.header['arrays'].items()
+        }
+
+
+# -----------------------------------------------------------------
+# PART 1c: Memoization ของผลลัพธ์ (LRU cache ตาม Input ที่ quantize แล้ว)
+# -----------------------------------------------------------------
+
+# ความละเอียดของ Input ที่ฟอร์มใน app.py รับได้ (อายุเป็นจำนวนเต็ม, รายได้ทีละ 1,000 บาท)
+# ใช้เป็น quantization ของ RecommendationCache ได้โดยไม่ทำให้ผลลัพธ์ของแอปเปลี่ยน
+APP_INPUT_QUANTIZATION = {
+    'age': 1,
+    'income': 1000,
+    'time_horizon': 1,
+    'risk_tolerance': 1,
+}
+
+
+class RecommendationCache:
+    """
+    Cache แบบจำกัดขนาดสำหรับผลลัพธ์ที่คำนวณซ้ำบ่อย (ใช้ร่วมกันหลาย thread ได้)
+
+    quantization: {ชื่อ field: step} ปัด field นั้นเป็นพหุคูณของ step ก่อนใช้เป็น key
+                  (field ที่ไม่ระบุใช้ค่าตามจริง) ผลลัพธ์ของทั้ง bucket จะคำนวณจากค่าที่ปัดแล้ว
+    maxsize:      จำนวน entry สูงสุดก่อนเริ่ม evict
+    policy:       'lru' (evict entry ที่ไม่ได้ใช้นานที่สุด) หรือ 'fifo' (evict entry ที่เก่าที่สุด)
+    """
+
+    def __init__(self, maxsize=4096, quantization=None, policy='lru'):
+        if maxsize < 1:
+            raise ValueError("maxsize must be at least 1.")
+        if policy not in ('lru', 'fifo'):
+            raise ValueError(f"Unknown eviction policy '{policy}'; expected 'lru' or 'fifo'.")
+        self.maxsize = maxsize
+        self.quantization = dict(quantization or {})
+        self.policy = policy
+        self._entries = collections.OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def key(self, fields):
+        """สร้าง key จาก {ชื่อ field: ค่า} (ลำดับตาม fields) หลัง quantize แล้ว"""
+        key = []
+        for name, value in fields.items():
+            value = float(value)
+            step = self.quantization.get(name)
+            if step:
+                value = round(value / step) * step
+            key.append(value)
+        return tuple(key)
+
+    def get_or_compute(self, key, compute):
+        """คืนค่าจาก cache ถ้ามี ไม่เช่นนั้นเรียก compute() แล้วเก็บผลไว้"""
+        with self._lock:
+            if key in self._entries:
+                self.hits += 1
+                if self.policy == 'lru':
+                    self._entries.move_to_end(key)
+                return self._entries[key]
+            self.misses += 1
+
+        value = compute()
+        if value is None:
+            return None
+
+        with self._lock:
+            self._entries[key] = value
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+        return value
+
+    def stats(self):
+        """ตัวนับสำหรับปรับขนาด cache จาก traffic จริง"""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'size': len(self._entries),
+                'maxsize': self.maxsize,
+                'hit_rate': self.hits / lookups if lookups else 0.,
+            }
+
+    def clear(self):
+        """ล้าง entry และตัวนับทั้งหมด"""
+        with self._lock:
+            self._entries.clear()
+            self.hits = self.misses = self.evictions = 0
+
+
+def _copy_result(result):
+    # คืนสำเนาให้ผู้เรียก เพื่อไม่ให้การแก้ไขผลลัพธ์ไปกระทบค่าที่อยู่ใน cache
+    return {key: list(value) if isinstance(value, list) else value
+            for key, value in result.items()}
+
 
 class FuzzyInvestmentEngine:
     """
@@ -15,168 +1149,574 @@ class FuzzyInvestmentEngine:
     เพื่อแนะนำสัดส่วนการลงทุน (Asset Allocation)
     """
 
-    def __init__(self):
-        # --- 1. กำหนดตัวแปร Input (Antecedents) ---
+    def __init__(self, artifact=None, defuzz='analytic', backend='skfuzzy', cache=None,
+                 profiler=None, spec=None, spec_cache_dir=None, precision='float64', resolution=None):
+        # defuzz -> วิธี Defuzzify ของ batch path (ดู DEFUZZ_METHODS)
+        if defuzz not in DEFUZZ_METHODS:
+            raise ValueError(f"Unknown defuzz method '{defuzz}'; expected one of {list(DEFUZZ_METHODS)}.")
+        self.defuzz = defuzz
 
-        # อายุ (Age): 18 - 80
-        self.age = ctrl.Antecedent(np.arange(18, 81, 1), 'age')
-        self.age['young'] = fuzz.trapmf(self.age.universe, [18, 18, 30, 35])
-        self.age['middle_aged'] = fuzz.trimf(self.age.universe, [30, 45, 55])
-        self.age['senior'] = fuzz.trapmf(self.age.universe, [50, 60, 80, 80])
-
-        # รายได้ (Income): 15,000 - 500,000
-        self.income = ctrl.Antecedent(np.arange(15000, 500001, 1000), 'income')
-        self.income['low'] = fuzz.trapmf(self.income.universe, [15000, 15000, 40000, 60000])
-        self.income['medium'] = fuzz.trimf(self.income.universe, [45000, 80000, 120000])
-        self.income['high'] = fuzz.trapmf(self.income.universe, [100000, 150000, 500000, 500000])
-
-        # ระยะเวลาลงทุน (Time Horizon): 1 - 30 ปี
-        self.time_horizon = ctrl.Antecedent(np.arange(1, 31, 1), 'time_horizon')
-        self.time_horizon['short'] = fuzz.trapmf(self.time_horizon.universe, [1, 1, 3, 5])
-        self.time_horizon['medium'] = fuzz.trimf(self.time_horizon.universe, [3, 7, 12])
-        self.time_horizon['long'] = fuzz.trapmf(self.time_horizon.universe, [10, 15, 30, 30])
-        
-        # ความเสี่ยง (Risk Tolerance): 1 - 10
-        self.risk_tolerance = ctrl.Antecedent(np.arange(1, 11, 1), 'risk_tolerance')
-        self.risk_tolerance['low'] = fuzz.trapmf(self.risk_tolerance.universe, [1, 1, 3, 5])
-        self.risk_tolerance['medium'] = fuzz.trimf(self.risk_tolerance.universe, [3, 5, 7])
-        self.risk_tolerance['high'] = fuzz.trapmf(self.risk_tolerance.universe, [5, 7, 10, 10])
+        # backend -> ตัวประมวลผลของ calculate_portfolio
+        #   'skfuzzy' - ControlSystemSimulation (reference, ค่าเริ่มต้น)
+        #   'fused'   - fused evaluator แบบ NumPy ล้วน (ใช้ร่วมกับ batch path, ไม่ต้องโหลด skfuzzy)
+        #   'jit'     - loop เดียวต่อแถวที่ compile ด้วย Numba (ทั้ง calculate_portfolio และ batch path)
+        #               ถ้าไม่ได้ติดตั้ง Numba จะใช้ fused evaluator แบบ NumPy แทน (ดู engine.jit)
+        if backend not in ('skfuzzy', 'fused', 'jit'):
+            raise ValueError(f"Unknown backend '{backend}'; expected 'skfuzzy', 'fused' or 'jit'.")
+        if backend == 'jit' and defuzz != 'analytic':
+            raise ValueError("The 'jit' backend supports defuzz='analytic' only.")
+        self.backend = backend
+        self.jit = _jit_kernel() if backend == 'jit' else None
 
-        # --- 2. กำหนดตัวแปร Output (Consequents) ---
-        # เราจะกำหนดสัดส่วนสำหรับแต่ละสินทรัพย์ (0% - 100%)
-        
-        universe = np.arange(0, 101, 1)
-        self.equity = ctrl.Consequent(universe, 'equity') # หุ้น
-        self.bonds = ctrl.Consequent(universe, 'bonds')   # พันธบัตร
-        self.cash = ctrl.Consequent(universe, 'cash')     # เงินฝาก
-
-        # กำหนด Membership functions สำหรับ Output
-        names = ['low', 'medium', 'high']
-        self.equity.automf(names=names)
-        self.bonds.automf(names=names)
-        self.cash.automf(names=names)
-
-        # --- 3. กำหนดกฎ (Rules) ---
-        
-        # กฎที่ 1: Aggressive (เสี่ยงสูง)
-        # IF Risk=High AND (Age=Young OR Time=Long) THEN Equity=High, Bonds=Low, Cash=Low
-        rule1 = ctrl.Rule(
-            self.risk_tolerance['high'] & (self.age['young'] | self.time_horizon['long']),
-            (self.equity['high'], self.bonds['low'], self.cash['low'])
-        )
+        # spec -> นิยามตัวแปร/กฎจาก spec (dict, ไฟล์ JSON/YAML หรือ CompiledRuleBase)
+        # แทนตารางใน PART 0; spec_cache_dir -> เก็บ/โหลดผล compile ตาม hash ของ spec
+        if spec is None:
+            self.rulebase = default_rulebase()
+        elif isinstance(spec, CompiledRuleBase):
+            self.rulebase = spec
+        else:
+            self.rulebase = compile_spec(spec, spec_cache_dir)
+        if artifact is not None:
+            self._check_default_spec()
 
-        # กฎที่ 2: Conservative (ปลอดภัย)
-        # IF Risk=Low OR Age=Senior THEN Equity=Low, Bonds=High, Cash=Medium
-        rule2 = ctrl.Rule(
-            self.risk_tolerance['low'] | self.age['senior'] | self.time_horizon['short'],
-            (self.equity['low'], self.bonds['high'], self.cash['medium'])
-        )
+        # precision  -> dtype ของ fused kernel / batch path ('float64' หรือ 'float32' ที่เร็วกว่า)
+        # resolution -> universe ของ skfuzzy และของ defuzz='universe' (ดู resolution_universes)
+        # ดูความคลาดเคลื่อนเทียบกับค่าเริ่มต้นด้วย engine.deviation_report()
+        if precision not in PRECISIONS:
+            raise ValueError(f"Unknown precision '{precision}'; expected one of {list(PRECISIONS)}.")
+        self.precision = precision
+        self.resolution = dict(resolution or {})
+        self._universes = resolution_universes(self.resolution, self.rulebase)
+        if self._universes and artifact is not None:
+            raise ValueError("A custom resolution cannot be combined with an artifact.")
+        if precision != 'float64' or 'output' in self._universes:
+            self.rulebase = self.rulebase.variant(PRECISIONS[precision], self._universes.get('output'))
 
-        # กฎที่ 3: Balanced (สมดุล)
-        # IF Risk=Medium AND Time=Medium AND Income=Medium THEN Equity=Medium, Bonds=Medium, Cash=Low
-        rule3 = ctrl.Rule(
-            self.risk_tolerance['medium'] & self.time_horizon['medium'] & self.income['medium'],
-            (self.equity['medium'], self.bonds['medium'], self.cash['low'])
-        )
-        
-        # กฎที่ 4: Wealthy Conservative (มีรายได้สูง แต่รับความเสี่ยงได้น้อย)
-        rule4 = ctrl.Rule(
-            self.income['high'] & self.risk_tolerance['low'],
-            (self.equity['low'], self.bonds['medium'], self.cash['high'])
-        )
+        # artifact -> ใช้ state ที่ compile ไว้แล้ว (EngineArtifact หรือ path ของไฟล์)
+        # ถ้ามี artifact หรือ backend ไม่ใช่ 'skfuzzy' จะเลื่อนการสร้าง ControlSystem
+        # (และการ import skfuzzy) ไปจนกว่าจะต้องใช้ skfuzzy จริง
+        self._lock = threading.Lock()
+        self._membership = None
+        self.advisor = None
+        if artifact is not None:
+            if not isinstance(artifact, EngineArtifact):
+                artifact = EngineArtifact(artifact)
+            self._membership = artifact.arrays
+        elif backend == 'skfuzzy':
+            self._build_control_system()
+
+        # --- 5. (ตัวเลือก) Cache ของ calculate_portfolio ---
+        # cache=True -> RecommendationCache() ค่าเริ่มต้น (ไม่ quantize), หรือส่ง instance ที่ตั้งค่าเอง
+        self.cache = RecommendationCache() if cache is True else cache
+
+        # --- 6. (ตัวเลือก) Profiling ราย stage ---
+        # profiler=True -> StageProfiler() ดูผลด้วย engine.profiler.report()
+        self.profiler = StageProfiler() if profiler is True else profiler
+
+    def _build_control_system(self):
+        ctrl = _skfuzzy_control()
+        membership = self._membership
+        spec = self.rulebase.spec
+
+        # --- 1. กำหนดตัวแปร Input (Antecedents) ---
+        # (Membership functions อยู่ใน INPUT_TERMS ด้านบน หรือใน spec)
+        # (universe ตาม resolution ถ้ากำหนดไว้)
+        universes = self._universes
+        self.age = _make_antecedent('age', membership, spec, universes.get('age'))                 # อายุ (Age): 18 - 80
+        self.income = _make_antecedent('income', membership, spec, universes.get('income'))        # รายได้ (Income): 15,000 - 500,000
+        self.time_horizon = _make_antecedent('time_horizon', membership, spec,
+                                             universes.get('time_horizon'))                       # ระยะเวลาลงทุน (Time Horizon): 1 - 30 ปี
+        self.risk_tolerance = _make_antecedent('risk_tolerance', membership, spec,
+                                               universes.get('risk_tolerance'))                   # ความเสี่ยง (Risk Tolerance): 1 - 10
+
+        # --- 2. กำหนดตัวแปร Output (Consequents) ---
+        # เราจะกำหนดสัดส่วนสำหรับแต่ละสินทรัพย์ (0% - 100%) ตาม OUTPUT_NAMES
+        # เช่น self.equity (หุ้น), self.bonds (พันธบัตร), self.cash (เงินฝาก)
+        # (Membership functions: automf 3 ระดับตาม OUTPUT_TERM_NAMES)
+        for name in self.rulebase.output_names:
+            setattr(self, name, _make_consequent(name, membership, spec, universes.get('output')))
+
+        # --- 3. กำหนดกฎ (Rules) จาก RULES (หรือจาก spec) ---
+        variables = {name: getattr(self, name) for name in INPUT_NAMES + self.rulebase.output_names}
+        terms = {name: spec['inputs'][name]['terms'] for name in INPUT_NAMES}
+        rules = [
+            ctrl.Rule(
+                _antecedent_to_ctrl(_parse_antecedent(rule['if'], terms), variables),
+                tuple(variables[output][label] for output, label in rule['then'].items())
+            )
+            for rule in spec['rules']
+        ]
 
         # --- 4. สร้างระบบ Control System ---
-        self.investment_ctrl = ctrl.ControlSystem([rule1, rule2, rule3, rule4])
+        self.investment_ctrl = ctrl.ControlSystem(rules)
         self.advisor = ctrl.ControlSystemSimulation(self.investment_ctrl)
 
     def calculate_portfolio(self, user_age, user_income, user_time, user_risk):
         """
         รับ Input จากผู้ใช้และคำนวณสัดส่วนพอร์ต
         """
+        if self.cache is None:
+            return self._calculate(user_age, user_income, user_time, user_risk)
+
+        try:
+            key = self.cache.key(dict(zip(INPUT_NAMES, (user_age, user_income, user_time, user_risk))))
+        except (TypeError, ValueError):
+            # Input ที่ไม่ใช่ตัวเลข -> ไม่ผ่าน cache ให้ path ปกติแจ้ง error เอง
+            return self._calculate(user_age, user_income, user_time, user_risk)
+        result = self.cache.get_or_compute(key, lambda: self._calculate(*key))
+        return None if result is None else _copy_result(result)
+
+    def _calculate(self, user_age, user_income, user_time, user_risk):
+        if self.backend != 'skfuzzy':
+            return self._calculate_fused(user_age, user_income, user_time, user_risk)
+        return self._calculate_reference(user_age, user_income, user_time, user_risk)
+
+    def _calculate_fused(self, user_age, user_income, user_time, user_risk):
+        """
+        คำนวณด้วย fused evaluator (NumPy หรือ kernel ของ backend 'jit'): fuzzify แต่ละ Input ครั้งเดียว
+        คำนวณ firing strength ของแต่ละกฎครั้งเดียว แล้วกระจายไปทุก Output พร้อมกัน
+        """
+        try:
+            with _stage(self.profiler, 'input'):
+                inputs = _prepare_batch_inputs(user_age, user_income, user_time, user_risk, self.rulebase)
+        except (TypeError, ValueError) as e:
+            print(f"Error setting inputs: {e}")
+            print("Please ensure inputs are within the defined ranges.")
+            return None
+        row = self._evaluate(inputs)[0]
+        return dict(zip(self.rulebase.output_names, row.tolist()))
+
+    def _evaluate(self, inputs):
+        if self.jit is not None:
+            return _evaluate_batch_jit(inputs, self.rulebase, self.jit, self.profiler)
+        return _evaluate_batch(inputs, self.defuzz, self.profiler, self.rulebase)
+
+    def _calculate_reference(self, user_age, user_income, user_time, user_risk):
+        """
+        คำนวณผ่าน ControlSystemSimulation ของ skfuzzy (reference path)
+
+        ControlSystemSimulation (และตัวแปรใน ControlSystem) เก็บ input/output
+        ไว้ใน object จึง lock ให้คำนวณได้ทีละ thread; path อื่น (fused, jit)
+        ไม่มี state ที่เปลี่ยนแปลง จึงเรียกพร้อมกันหลาย thread ได้โดยไม่ต้อง lock
+        """
+        with self._lock:
+            if self.advisor is None:
+                self._build_control_system()
+            return self._simulate(user_age, user_income, user_time, user_risk)
+
+    def _simulate(self, user_age, user_income, user_time, user_risk):
+        profiler = self.profiler
+
         # 1. ป้อนค่า Input
         try:
-            self.advisor.input['age'] = user_age
-            self.advisor.input['income'] = user_income
-            self.advisor.input['time_horizon'] = user_time
-            self.advisor.input['risk_tolerance'] = user_risk
+            with _stage(profiler, 'input'):
+                if not np.isfinite(np.array([user_age, user_income, user_time, user_risk], dtype=float)).all():
+                    raise ValueError("Inputs must be finite numbers; got NaN or infinity.")
+                self.advisor.input['age'] = user_age
+                self.advisor.input['income'] = user_income
+                self.advisor.input['time_horizon'] = user_time
+                self.advisor.input['risk_tolerance'] = user_risk
         except Exception as e:
             print(f"Error setting inputs: {e}")
             print("Please ensure inputs are within the defined ranges.")
             return None
 
         # 2. คำนวณ (Defuzzification)
-        self.advisor.compute()
+        with _stage(profiler, 'inference'):
+            self.advisor.compute()
 
         # 3. ดึงผลลัพธ์
-        raw_results = {
-            'equity': self.advisor.output['equity'],
-            'bonds': self.advisor.output['bonds'],
-            'cash': self.advisor.output['cash']
-        }
+        # (ถ้าไม่มีกฎใด fire เลย skfuzzy จะไม่ใส่ค่า output -> ถือว่าเป็น 0)
+        raw_results = {name: self.advisor.output.get(name, 0) for name in self.rulebase.output_names}
 
         # 4. Normalize ผลลัพธ์ให้รวมเป็น 100% (สำคัญมาก!)
-        total = sum(raw_results.values())
-        if total == 0:
-            return {'equity': 0, 'bonds': 0, 'cash': 100} # Default case
-
-        normalized_results = {
-            'equity': (raw_results['equity'] / total) * 100,
-            'bonds': (raw_results['bonds'] / total) * 100,
-            'cash': (raw_results['cash'] / total) * 100
-        }
+        with _stage(profiler, 'normalize'):
+            total = sum(raw_results.values())
+            if total == 0:
+                # Default case
+                return {name: 100 if name == 'cash' else 0 for name in self.rulebase.output_names}
+
+            normalized_results = {name: (value / total) * 100 for name, value in raw_results.items()}
         
         return normalized_results
 
+    def calculate_portfolio_batch(self, user_age, user_income=None, user_time=None, user_risk=None, trace=False):
+        """
+        คำนวณสัดส่วนพอร์ตของลูกค้าหลายรายพร้อมกัน (vectorized)
+
+        รับ array ของ Input ทั้ง 4 ตัว หรือ DataFrame ที่มีคอลัมน์ตาม INPUT_NAMES
+        คืน array ขนาด (N, 3) เรียงคอลัมน์ตาม OUTPUT_NAMES (equity, bonds, cash)
+        ที่ normalize ให้แต่ละแถวรวมเป็น 100%
+
+        trace=True -> คืน (array, trace) โดย trace เป็น dict ของ array ตัวเลขที่อธิบายผล
+        ของทุกแถว: membership ของทุก term และ firing strength ของทุกกฎ (ดู _new_trace)
+
+        ความคลาดเคลื่อนเทียบกับ calculate_portfolio (skfuzzy):
+          defuzz='analytic' - ไม่เกิน 0.05 จุด % ต่อสินทรัพย์ (ส่วนต่างมาจาก skfuzzy
+                              ที่คำนวณบน universe แบบจุด จึงพลาดจุดหักมุมบางจุด)
+          defuzz='universe' - ไม่เกิน 0.5 จุด % ต่อสินทรัพย์
+        แถวที่ไม่มีกฎใด fire จะได้ผลแบบ Default case คือเงินฝาก 100%
+        Input ที่เป็น NaN / infinity -> ValueError (ดู _prepare_batch_inputs)
+        """
+        with _stage(self.profiler, 'input'):
+            inputs = _prepare_batch_inputs(user_age, user_income, user_time, user_risk, self.rulebase)
+        if not trace:
+            return self._evaluate(inputs)
+
+        explanation = _new_trace(self.rulebase, inputs[INPUT_NAMES[0]].shape[0])
+        return _evaluate_batch(inputs, self.defuzz, self.profiler, self.rulebase, explanation), explanation
+
+    def session(self, user_age, user_income, user_time, user_risk):
+        """เริ่ม AdvisorSession ที่คำนวณใหม่เฉพาะส่วนที่เปลี่ยนเมื่อปรับ Input ทีละตัว"""
+        return AdvisorSession(self, user_age, user_income, user_time, user_risk)
+
+    def _check_default_spec(self):
+        # artifact สร้างจากนิยามใน PART 0 เท่านั้น
+        if self.rulebase.fingerprint != definitions_fingerprint():
+            raise ValueError("Artifacts are built from the default definitions; "
+                             "they cannot be combined with a custom spec.")
+
+    def calculate_portfolio_compact(self, user_age, user_income=None, user_time=None, user_risk=None):
+        """
+        เหมือน calculate_portfolio_batch แต่คืน structured array แบบ COMPACT_RESULT_DTYPE
+        (สัดส่วน float32 + รหัสประเภทพอร์ต/ตัวอย่าง) แทน array float64 และข้อความต่อแถว
+        แปลงเป็นข้อความด้วย render_recommendation(record) เมื่อจะแสดงผลเท่านั้น
+        """
+        if self.rulebase.output_names != OUTPUT_NAMES:
+            raise ValueError(f"Compact results need the outputs {OUTPUT_NAMES}.")
+        return compact_results(self.calculate_portfolio_batch(user_age, user_income, user_time, user_risk))
+
+    def sweep(self, axes, fixed):
+        """
+        What-if: ไล่ค่า Input 1 หรือ 2 ตัวโดยตรึงตัวที่เหลือ แล้วคำนวณทั้ง grid ใน batch เดียว
+
+        axes:  {ตัวแปร: array ของค่าที่จะไล่ หรือ int = จำนวนจุดที่กระจายทั่ว universe}
+        fixed: {ตัวแปร: ค่า} ของตัวแปรที่เหลือ (มีตัวแปรใน axes ปนมาได้ จะถูกข้ามไป
+               เช่นส่ง AdvisorSession.inputs ได้ทันที)
+        คืน {'axes': {ตัวแปร: array}, 'allocations': {สินทรัพย์: array ขนาดตาม axes}}
+        (2 แกน -> array ขนาด (len แกนแรก, len แกนที่สอง) ใช้วาด heatmap ได้โดยตรง)
+        """
+        if not 1 <= len(axes) <= 2:
+            raise ValueError("sweep() takes one or two axes.")
+        unknown = sorted(set(axes) - set(INPUT_NAMES))
+        if unknown:
+            raise ValueError(f"Unknown sweep axes {unknown}; expected names from {INPUT_NAMES}.")
+        missing = [name for name in INPUT_NAMES if name not in axes and name not in fixed]
+        if missing:
+            raise ValueError(f"Missing fixed values for {missing}.")
+
+        points = {}
+        for name, values in axes.items():
+            if isinstance(values, int):
+                lo, hi = self.rulebase.input_bounds[INPUT_NAMES.index(name)]
+                values = np.linspace(lo, hi, values)
+            points[name] = np.asarray(values, dtype=float)
+
+        mesh = np.meshgrid(*points.values(), indexing='ij')
+        shape = mesh[0].shape
+        columns = dict(zip(points, (m.ravel() for m in mesh)))
+        inputs = {name: columns[name] if name in columns else np.full(mesh[0].size, float(fixed[name]))
+                  for name in INPUT_NAMES}
+        values = self.calculate_portfolio_batch(inputs)
+        return {
+            'axes': points,
+            'allocations': {name: values[:, j].reshape(shape)
+                            for j, name in enumerate(self.rulebase.output_names)},
+        }
+
+    def deviation_report(self, reference=None, n_samples=500, seed=0):
+        """
+        เทียบผลของ engine นี้ (precision / resolution ที่ตั้งไว้) กับ reference
+        (ค่าเริ่มต้น: engine ที่ใช้ spec, backend และ defuzz เดียวกันแต่ความละเอียดปกติ)
+        ที่จุดสุ่มทั่ว universe และจุดสุ่มบน breakpoints ของ membership (จุดที่ universe
+        แบบหยาบคลาดเคลื่อนมากที่สุด) ทั้ง batch path และ calculate_portfolio
+        คืน max/mean absolute error ต่อสินทรัพย์ (จุด %) แยกตาม path
+        """
+        if reference is None:
+            reference = FuzzyInvestmentEngine(defuzz=self.defuzz, backend=self.backend, spec=self.rulebase.spec)
+        rng = np.random.default_rng(seed)
+        samples = {}
+        for v, name in enumerate(INPUT_NAMES):
+            lo, hi = self.rulebase.input_bounds[v]
+            breakpoints = np.clip(self.rulebase.term_points[self.rulebase.term_slices[name]].ravel(), lo, hi)
+            samples[name] = np.concatenate([rng.uniform(lo, hi, n_samples), rng.choice(breakpoints, n_samples)])
+        rows = list(zip(*(samples[name].tolist() for name in INPUT_NAMES)))
+
+        paths = {
+            'batch': (self.calculate_portfolio_batch(samples), reference.calculate_portfolio_batch(samples)),
+            'scalar': tuple(np.array([list(engine._calculate(*row).values()) for row in rows])
+                            for engine in (self, reference)),
+        }
+        report = {'precision': self.precision, 'resolution': self.resolution, 'n_samples': len(rows)}
+        for path, (approx, exact) in paths.items():
+            errors = np.abs(approx.astype(float) - exact)
+            report[path] = {
+                'max_abs_error': dict(zip(self.rulebase.output_names, errors.max(axis=0).tolist())),
+                'mean_abs_error': dict(zip(self.rulebase.output_names, errors.mean(axis=0).tolist())),
+            }
+        self.max_deviation = max(max(report[path]['max_abs_error'].values()) for path in paths)
+        report['max_abs_error'] = self.max_deviation
+        return report
+
+    def save_artifact(self, path):
+        """
+        บันทึก state ที่ compile แล้วให้ worker อื่นเปิดใช้ด้วย
+        FuzzyInvestmentEngine(artifact=path) โดยไม่ต้องสร้างอะไรใหม่
+        """
+        self._check_default_spec()
+        save_artifact(path)
+
+# -----------------------------------------------------------------
+# PART 1d: Session สำหรับการปรับ Input ทีละตัว (Incremental re-evaluation)
+# -----------------------------------------------------------------
+
+class AdvisorSession:
+    """
+    การประเมินแบบ interactive ของลูกค้าหนึ่งราย (เช่นฟอร์มใน app.py ที่ปรับทีละช่อง)
+
+    เก็บ membership degree ของทุก term, ค่าของทุก clause และ firing strength ของทุกกฎไว้
+    update() จะ fuzzify ใหม่เฉพาะตัวแปรที่เปลี่ยน และคำนวณใหม่เฉพาะ clause ที่อ้างถึง
+    ตัวแปรนั้น ถ้า firing strength ไม่เปลี่ยนก็คืนผลเดิมโดยไม่ต้อง Defuzzify ใหม่
+    (ใช้ fused kernel ของ engine.rulebase เสมอ: ไม่ใช้ engine.backend หรือ engine.cache
+    และไม่ควรใช้ instance เดียวกันหลาย thread)
+    """
+
+    def __init__(self, engine, user_age, user_income, user_time, user_risk):
+        self.engine = engine
+        self.rulebase = engine.rulebase
+        k = self.rulebase.term_var.size
+        self._values = dict.fromkeys(INPUT_NAMES)
+        # literal: [membership ของทุก term, NOT ของทุก term, ค่าคงที่ 1] (ตาม clause_literals)
+        self._literals = np.ones((1, 2 * k + 1), dtype=self.rulebase.dtype)
+        self._clauses = np.zeros((1, self.rulebase.clause_literals.shape[0]), dtype=self.rulebase.dtype)
+        self._strengths = None
+        self.result = None
+        self.recomputed = ()
+        self.update(**dict(zip(INPUT_NAMES, (user_age, user_income, user_time, user_risk))))
+
+    @property
+    def inputs(self):
+        """ค่า Input ปัจจุบัน (หลัง clip ให้อยู่ใน universe)"""
+        return dict(self._values)
+
+    def update(self, **changes):
+        """
+        เปลี่ยน Input บางตัวตามชื่อใน INPUT_NAMES เช่น update(risk_tolerance=8)
+        แล้วคืนสัดส่วนพอร์ตใหม่ (dict แบบเดียวกับ calculate_portfolio)
+        recomputed: ชื่อตัวแปรที่ถูกคำนวณใหม่ในการ update ครั้งล่าสุด
+        """
+        unknown = sorted(set(changes) - set(INPUT_NAMES))
+        if unknown:
+            raise ValueError(f"Unknown inputs {unknown}; expected names from {INPUT_NAMES}.")
+
+        rulebase = self.rulebase
+        changed = []
+        for name, value in changes.items():
+            lo, hi = rulebase.input_bounds[INPUT_NAMES.index(name)]
+            value = float(value)
+            if not np.isfinite(value):
+                raise ValueError(f"Input '{name}' must be a finite number, got {value}.")
+            value = min(max(value, lo), hi)
+            if value != self._values[name]:
+                self._values[name] = value
+                changed.append(name)
+        self.recomputed = tuple(changed)
+        if not changed:
+            return dict(self.result)
+
+        profiler = self.engine.profiler
+        k = rulebase.term_var.size
+        with _stage(profiler, 'fuzzify'):
+            for name in changed:
+                terms = rulebase.term_slices[name]
+                x = np.full((1, terms.stop - terms.start), self._values[name], dtype=rulebase.dtype)
+                mu = _trap_degrees(x, rulebase.term_points[terms])
+                self._literals[:, terms] = mu
+                self._literals[:, terms.start + k:terms.stop + k] = 1. - mu
+        with _stage(profiler, 'rules'):
+            clauses = np.unique(np.concatenate([rulebase.variable_clauses[name] for name in changed]))
+            self._clauses[:, clauses] = self._literals[:, rulebase.clause_literals[clauses]].min(axis=2)
+            strengths = np.maximum.reduceat(self._clauses, rulebase.rule_clauses, axis=1)
+
+        if self.result is not None and np.array_equal(strengths, self._strengths):
+            return dict(self.result)
+        self._strengths = strengths
+
+        with _stage(profiler, 'aggregate'):
+            cuts = rulebase.term_cuts(strengths)
+        with _stage(profiler, 'defuzzify'):
+            raw = DEFUZZ_METHODS[self.engine.defuzz](cuts, rulebase)
+        with _stage(profiler, 'normalize'):
+            row = rulebase.normalize(raw)[0]
+        self.result = dict(zip(rulebase.output_names, row.tolist()))
+        return dict(self.result)
+
+
 # -----------------------------------------------------------------
 # PART 2: POST-PROCESSING WRAPPER (Simple Rule-Based)
 # -----------------------------------------------------------------
 
-def get_example_recommendations(equity_pct, bonds_pct, cash_pct):
+# ประเภทพอร์ตตามสัดส่วนหุ้น: (key, ชื่อที่แสดง) เรียงจากเสี่ยงต่ำไปสูง
+# สัดส่วนหุ้น > PORTFOLIO_TYPE_THRESHOLDS[i] -> ประเภทถัดไป (เช่น > 70% = Aggressive)
+PORTFOLIO_TYPES = (
+    ('conservative', 'Conservative (เน้นปลอดภัย)'),
+    ('balanced', 'Balanced (สมดุล)'),
+    ('aggressive', 'Aggressive (เน้นเติบโตสูง)'),
+)
+PORTFOLIO_TYPE_THRESHOLDS = (40, 70)
+
+# ระดับความเสี่ยงที่แสดงในแอป (ตรงกับ PORTFOLIO_TYPES ทีละลำดับ)
+PORTFOLIO_RISK_LEVELS = ('ต่ำ', 'ปานกลาง', 'สูง')
+
+
+# ตัวอย่างสินทรัพย์ตามช่วงสัดส่วน: สินทรัพย์ -> (เกณฑ์, ตัวอย่างของแต่ละช่วง)
+# ช่วงเรียงจากสัดส่วนต่ำไปสูง; สัดส่วน > เกณฑ์[i] -> ช่วงถัดไป
+EXAMPLE_BUCKETS = {
+    'equity': ((20, 60), (
+        ("กองทุนหุ้นปันผล (เน้นกระแสเงินสด)",),
+        ("กองทุนดัชนี SET50 (ในประเทศ)",),
+        ("กองทุนดัชนี S&P 500 (ตปท.)", "กองทุนหุ้นเทคโนโลยี (ราย Sector)"),
+    )),
+    'bonds': ((20, 50), (
+        ("กองทุนตราสารหนี้ระยะสั้น",),
+        ("กองทุนตราสารหนี้ผสม (ภาครัฐและเอกชน)",),
+        ("พันธบัตรรัฐบาล (ปลอดภัยสูง)",),
+    )),
+    'cash': ((20,), (
+        ("เงินฝากออมทรัพย์ (สำหรับสภาพคล่อง)",),
+        ("เงินฝากออมทรัพย์ดอกเบี้ยสูง (E-Saving)", "กองทุนรวมตลาดเงิน (Money Market)"),
+    )),
+}
+
+# ผลลัพธ์แบบ compact ต่อลูกค้า 1 ราย (16 byte): สัดส่วนพอร์ตแบบ float32 และรหัส
+# ของประเภทพอร์ต (index ใน PORTFOLIO_TYPES) / ช่วงของตัวอย่าง (index ใน EXAMPLE_BUCKETS)
+# ข้อความที่แสดงผลดึงจากตารางด้านบนเมื่อจะแสดงเท่านั้น (render_recommendation)
+COMPACT_RESULT_DTYPE = np.dtype(
+    [(name, np.float32) for name in OUTPUT_NAMES]
+    + [('portfolio_type', np.uint8)]
+    + [(f'{name}_bucket', np.uint8) for name in EXAMPLE_BUCKETS]
+)
+
+
+def _bin_index(thresholds, pct):
     """
-    ฟังก์ชัน "Wrapper" นี้จะให้ "ตัวอย่าง" สินทรัพย์
-    โดยใช้ตรรกะ IF-THEN ธรรมดา (ไม่ใช่ Fuzzy)
+    index ของช่วงตาม thresholds แบบ vectorized (ผลเท่ากับ bisect.bisect_left ทีละค่า)
+    NaN -> 0 เหมือน bisect_left และเงื่อนไข if/elif เดิม (np.searchsorted ให้ NaN เป็นช่วงสุดท้าย)
     """
-    
-    recommendations = {
-        'portfolio_type': '',
-        'equity_examples': [],
-        'bonds_examples': [],
-        'cash_examples': []
+    pct = np.asarray(pct, dtype=float)
+    return np.where(np.isnan(pct), 0, np.searchsorted(thresholds, pct, side='left'))
+
+
+def classify_portfolio_types(equity_pct):
+    """index ของประเภทพอร์ตใน PORTFOLIO_TYPES จากสัดส่วนหุ้น (array, vectorized)"""
+    return _bin_index(PORTFOLIO_TYPE_THRESHOLDS, equity_pct)
+
+
+def portfolio_risk_level(equity_pct):
+    """ระดับความเสี่ยง (PORTFOLIO_RISK_LEVELS) จากสัดส่วนหุ้น ใช้เกณฑ์เดียวกับประเภทพอร์ต"""
+    return PORTFOLIO_RISK_LEVELS[bisect.bisect_left(PORTFOLIO_TYPE_THRESHOLDS, equity_pct)]
+
+
+def recommendation_codes(equity_pct, bonds_pct, cash_pct):
+    """
+    จัดกลุ่มสัดส่วนพอร์ตทุกแถวพร้อมกันด้วย binned lookup (_bin_index)
+    -> {'portfolio_type', 'equity_bucket', 'bonds_bucket', 'cash_bucket'}: array ของ index
+    ในตาราง PORTFOLIO_TYPES / EXAMPLE_BUCKETS
+    """
+    codes = {'portfolio_type': classify_portfolio_types(equity_pct)}
+    for name, pct in (('equity', equity_pct), ('bonds', bonds_pct), ('cash', cash_pct)):
+        codes[f'{name}_bucket'] = _bin_index(EXAMPLE_BUCKETS[name][0], pct)
+    return codes
+
+
+def _object_table(items):
+    """array 1 มิติ dtype=object ของ items (tuple ไม่ถูกแตกเป็นมิติที่สอง)"""
+    table = np.empty(len(items), dtype=object)
+    for i, item in enumerate(items):
+        table[i] = item
+    return table
+
+
+# ตารางข้อความสำหรับ index ด้วยรหัสทั้ง array (อ้างอิง string/tuple เดิม ไม่สร้างใหม่ต่อแถว)
+_PORTFOLIO_TYPE_LABELS = _object_table([label for _, label in PORTFOLIO_TYPES])
+_PORTFOLIO_RISK_LEVELS = _object_table(PORTFOLIO_RISK_LEVELS)
+_EXAMPLE_GROUPS = {name: _object_table(examples) for name, (_, examples) in EXAMPLE_BUCKETS.items()}
+
+
+def get_example_recommendations_batch(equity_pct, bonds_pct, cash_pct, separator=None):
+    """
+    get_example_recommendations แบบ vectorized: รับ array ของสัดส่วน คืน dict ของ array
+      'portfolio_type'     ข้อความประเภทพอร์ต
+      'risk_level'         ระดับความเสี่ยง (PORTFOLIO_RISK_LEVELS)
+      '<สินทรัพย์>_examples' tuple ของตัวอย่างจาก EXAMPLE_BUCKETS
+                           (separator เช่น ', ' -> ข้อความที่ต่อตัวอย่างด้วย separator แทน tuple)
+    """
+    codes = recommendation_codes(equity_pct, bonds_pct, cash_pct)
+    results = {
+        'portfolio_type': _PORTFOLIO_TYPE_LABELS[codes['portfolio_type']],
+        'risk_level': _PORTFOLIO_RISK_LEVELS[codes['portfolio_type']],
     }
+    for name in ('equity', 'bonds', 'cash'):
+        table = _EXAMPLE_GROUPS[name]
+        if separator is not None:
+            table = _object_table([separator.join(group) for group in table])
+        results[f'{name}_examples'] = table[codes[f'{name}_bucket']]
+    return results
 
-    # ตีความประเภทของพอร์ต
-    if equity_pct > 70:
-        recommendations['portfolio_type'] = 'Aggressive (เน้นเติบโตสูง)'
-    elif equity_pct > 40:
-        recommendations['portfolio_type'] = 'Balanced (สมดุล)'
-    else:
-        recommendations['portfolio_type'] = 'Conservative (เน้นปลอดภัย)'
-
-    # 1. ตีความสัดส่วนหุ้น (Equity)
-    if equity_pct > 60:
-        recommendations['equity_examples'].append("กองทุนดัชนี S&P 500 (ตปท.)")
-        recommendations['equity_examples'].append("กองทุนหุ้นเทคโนโลยี (ราย Sector)")
-    elif equity_pct > 20:
-        recommendations['equity_examples'].append("กองทุนดัชนี SET50 (ในประเทศ)")
-    else:
-        recommendations['equity_examples'].append("กองทุนหุ้นปันผล (เน้นกระแสเงินสด)")
 
-    # 2. ตีความสัดส่วนพันธบัตร (Bonds)
-    if bonds_pct > 50:
-        recommendations['bonds_examples'].append("พันธบัตรรัฐบาล (ปลอดภัยสูง)")
-    elif bonds_pct > 20:
-        recommendations['bonds_examples'].append("กองทุนตราสารหนี้ผสม (ภาครัฐและเอกชน)")
-    else:
-        recommendations['bonds_examples'].append("กองทุนตราสารหนี้ระยะสั้น")
+def compact_results(allocations):
+    """
+    แปลงผลของ calculate_portfolio_batch (array (N, O) ตาม OUTPUT_NAMES)
+    เป็น structured array แบบ COMPACT_RESULT_DTYPE
+    """
+    allocations = np.asarray(allocations)
+    records = np.empty(allocations.shape[0], dtype=COMPACT_RESULT_DTYPE)
+    for j, name in enumerate(OUTPUT_NAMES):
+        records[name] = allocations[:, j]
+    columns = (allocations[:, OUTPUT_NAMES.index(name)] for name in ('equity', 'bonds', 'cash'))
+    for field, codes in recommendation_codes(*columns).items():
+        records[field] = codes
+    return records
 
-    # 3. ตีความสัดส่วนเงินฝาก (Cash)
-    if cash_pct > 20:
-        recommendations['cash_examples'].append("เงินฝากออมทรัพย์ดอกเบี้ยสูง (E-Saving)")
-        recommendations['cash_examples'].append("กองทุนรวมตลาดเงิน (Money Market)")
-    else:
-        recommendations['cash_examples'].append("เงินฝากออมทรัพย์ (สำหรับสภาพคล่อง)")
 
-    return recommendations
+def render_recommendation(record):
+    """
+    ข้อความของผลลัพธ์แบบ compact หนึ่งแถว (record จาก compact_results)
+    -> dict แบบเดียวกับ get_example_recommendations
+    """
+    rendered = {'portfolio_type': PORTFOLIO_TYPES[record['portfolio_type']][1]}
+    for name, (_, examples) in EXAMPLE_BUCKETS.items():
+        rendered[f'{name}_examples'] = list(examples[record[f'{name}_bucket']])
+    return rendered
+
+
+def get_example_recommendations(equity_pct, bonds_pct, cash_pct, cache=None):
+    """
+    ฟังก์ชัน "Wrapper" นี้จะให้ "ตัวอย่าง" สินทรัพย์
+    โดยใช้ตรรกะ IF-THEN ธรรมดา (ไม่ใช่ Fuzzy)
+
+    cache: RecommendationCache (ตัวเลือก) key คือ equity/bonds/cash หลัง quantize
+    (ระวัง: step ที่หยาบอาจทำให้ค่าที่อยู่ใกล้เกณฑ์ 20/40/50/60/70% ถูกจัดกลุ่มผิด)
+    """
+    if cache is not None:
+        key = cache.key({'equity': equity_pct, 'bonds': bonds_pct, 'cash': cash_pct})
+        return _copy_result(cache.get_or_compute(key, lambda: _build_example_recommendations(*key)))
+    return _build_example_recommendations(equity_pct, bonds_pct, cash_pct)
+
+
+def _build_example_recommendations(equity_pct, bonds_pct, cash_pct):
+    # ประเภทของพอร์ตตาม PORTFOLIO_TYPES และตัวอย่างของแต่ละสินทรัพย์ตาม EXAMPLE_BUCKETS
+    # (list ใหม่ทุกครั้ง ผู้เรียกแก้ไขผลลัพธ์ได้โดยไม่กระทบตาราง)
+    def examples(name, pct):
+        thresholds, groups = EXAMPLE_BUCKETS[name]
+        return list(groups[bisect.bisect_left(thresholds, pct)])
+
+    return {
+        'portfolio_type': PORTFOLIO_TYPES[bisect.bisect_left(PORTFOLIO_TYPE_THRESHOLDS, equity_pct)][1],
+        'equity_examples': examples('equity', equity_pct),
+        'bonds_examples': examples('bonds', bonds_pct),
+        'cash_examples': examples('cash', cash_pct),
+    }
 
 # -----------------------------------------------------------------
 # MAIN: ส่วนสำหรับทดสอบการทำงาน (Demo Usage)
@@ -0,0 +1,198 @@
+# -----------------------------------------------------------------
+# PROJECT: Fuzzy Investment Advisor
+# FILE: incremental_scoring.py
+# AUTHOR: (Your Name) / Gemini AI
+# REQUIRES: pip install numpy
+# -----------------------------------------------------------------
+#
+# Re-score เฉพาะลูกค้าที่ Input เปลี่ยนจากรอบก่อน (เช่น batch รายคืน)
+# ScoreStore เก็บผลของรอบก่อนเป็นไฟล์ .npz ขนาดเล็ก: รหัสลูกค้า (เรียงแล้ว),
+# hash 64 บิตของ Input ที่ clip แล้ว และสัดส่วนพอร์ต ลูกค้าที่ hash ไม่เปลี่ยนใช้ผลเดิม
+# ทันที ที่เหลือส่งเข้า engine เป็น batch เดียวต่อ chunk
+#
+# Store ผูกกับ engine_fingerprint (นิยาม membership / กฎ และตัวเลือกที่มีผลต่อผลลัพธ์)
+# เมื่อ fingerprint ไม่ตรงกัน ทุกคนถูกคำนวณใหม่ (ผลเดิมใช้เทียบประเภทพอร์ตเท่านั้น)
+#
+# ใช้ผ่าน bulk_score.py:
+#   python bulk_score.py clients.csv scored.csv --store book.npz --id-column client_id \
+#       --type-changes type_changes.csv
+# -----------------------------------------------------------------
+
+import hashlib
+import json
+import os
+
+import numpy as np
+
+from fuzzy_investment_engine import (
+    INPUT_NAMES,
+    OUTPUT_NAMES,
+    PORTFOLIO_TYPES,
+    _atomic_write,
+    _prepare_batch_inputs,
+    classify_portfolio_types,
+    default_rulebase,
+)
+
+# เปลี่ยนเมื่อรูปแบบไฟล์ของ ScoreStore เปลี่ยน (ไฟล์รุ่นเก่าถือว่าไม่มี store)
+STORE_FORMAT = 1
+
+_FNV_OFFSET = np.uint64(0xcbf29ce484222325)
+_FNV_PRIME = np.uint64(0x100000001b3)
+
+
+def engine_fingerprint(engine):
+    """
+    Hash ของทุกอย่างที่มีผลต่อสัดส่วนพอร์ต: นิยาม membership / กฎ (fingerprint ของ rulebase)
+    วิธี Defuzzify, precision และ resolution (รองรับทั้ง FuzzyInvestmentEngine และ ParallelScorer)
+    """
+    rulebase = getattr(engine, 'rulebase', None) or default_rulebase()
+    payload = {
+        'definitions': rulebase.fingerprint,
+        'defuzz': getattr(engine, 'defuzz', 'analytic'),
+        'precision': getattr(engine, 'precision', 'float64'),
+        'resolution': getattr(engine, 'resolution', {}),
+    }
+    return hashlib.sha256(json.dumps(payload, sort_keys=True).encode('utf-8')).hexdigest()[:16]
+
+
+def input_hashes(inputs):
+    """Hash 64 บิตต่อแถวของ Input (dict ของ array ที่ clip แล้ว) จากบิตของค่า float64"""
+    n = inputs[INPUT_NAMES[0]].shape[0]
+    hashes = np.full(n, _FNV_OFFSET)
+    for name in INPUT_NAMES:
+        # + 0. ทำให้ -0.0 กลายเป็น 0.0 (ค่าเดียวกันต้องได้ hash เดียวกัน)
+        words = (np.asarray(inputs[name], dtype=np.float64) + 0.).view(np.uint64)
+        hashes ^= words
+        hashes *= _FNV_PRIME
+        hashes ^= hashes >> np.uint64(29)
+    return hashes
+
+
+def _normalize_ids(ids):
+    """รหัสลูกค้าเป็น int64 (ถ้าเป็นตัวเลขจำนวนเต็ม) หรือ string (กรณีอื่น) เพื่อเทียบ/บันทึกได้"""
+    ids = np.asarray(ids)
+    if ids.dtype.kind in 'iu':
+        return ids.astype(np.int64)
+    return ids.astype(str)
+
+
+class ScoreStore:
+    """
+    ผลของรอบก่อน: ids (N,) เรียงจากน้อยไปมากและไม่ซ้ำ, input_hash (N,) uint64,
+    allocations (N, O) ตาม OUTPUT_NAMES และ fingerprint ของ engine ที่ใช้คำนวณ
+    """
+
+    def __init__(self, ids, input_hash, allocations, fingerprint):
+        self.ids = ids
+        self.input_hash = input_hash
+        self.allocations = allocations
+        self.fingerprint = fingerprint
+
+    @classmethod
+    def empty(cls, fingerprint=None):
+        return cls(np.empty(0, dtype=np.int64), np.empty(0, dtype=np.uint64),
+                   np.empty((0, len(OUTPUT_NAMES))), fingerprint)
+
+    @classmethod
+    def load(cls, path):
+        """โหลด store (ไม่มีไฟล์หรือเป็นรูปแบบรุ่นเก่า -> store ว่าง)"""
+        if not os.path.exists(path):
+            return cls.empty()
+        with np.load(path) as data:
+            meta = json.loads(str(data['meta']))
+            if meta.get('format') != STORE_FORMAT or tuple(meta.get('outputs', ())) != OUTPUT_NAMES:
+                return cls.empty()
+            return cls(data['ids'], data['input_hash'], data['allocations'], meta['fingerprint'])
+
+    def save(self, path):
+        """บันทึกเป็นไฟล์ .npz (ผ่าน _atomic_write ของ engine)"""
+        meta = json.dumps({'format': STORE_FORMAT, 'fingerprint': self.fingerprint, 'outputs': OUTPUT_NAMES})
+        with _atomic_write(path) as f:
+            np.savez(f, meta=np.array(meta), ids=self.ids, input_hash=self.input_hash,
+                     allocations=self.allocations)
+
+    def lookup(self, ids):
+        """index ใน store ของแต่ละรหัส (-1 = ไม่มีในรอบก่อน)"""
+        if self.ids.size == 0 or (self.ids.dtype.kind == 'i') != (ids.dtype.kind == 'i'):
+            return np.full(ids.shape[0], -1, dtype=np.intp)
+        idx = np.searchsorted(self.ids, ids)
+        found = idx < self.ids.size
+        found[found] = self.ids[idx[found]] == ids[found]
+        return np.where(found, idx, -1)
+
+
+class IncrementalScorer:
+    """
+    คำนวณสัดส่วนพอร์ตทีละ chunk โดยใช้ผลเดิมจาก ScoreStore ของลูกค้าที่ Input ไม่เปลี่ยน
+    แล้วสะสม store ของรอบนี้ไว้บันทึกด้วย commit() (เรียกหลังประมวลผลครบทุก chunk เท่านั้น
+    ถ้าล้มกลางทาง store เดิมจึงไม่เสีย)
+
+    engine:     FuzzyInvestmentEngine หรือ ParallelScorer ที่ใช้คำนวณลูกค้าที่เปลี่ยน
+    store_path: ไฟล์ .npz ของ store (ยังไม่มีไฟล์ -> ทุกคนถูกคำนวณในรอบแรก)
+    id_column:  คอลัมน์รหัสลูกค้า (รหัสซ้ำในไฟล์ -> store เก็บแถวสุดท้าย)
+    """
+
+    def __init__(self, engine, store_path, id_column='client_id'):
+        self.engine = engine
+        self.store_path = store_path
+        self.id_column = id_column
+        self.fingerprint = engine_fingerprint(engine)
+        self.previous = ScoreStore.load(store_path)
+        # นิยามหรือตัวเลือกเปลี่ยน -> ไม่ใช้ผลเดิม (แต่ยังใช้เทียบประเภทพอร์ต)
+        self.invalidated = self.previous.ids.size > 0 and self.previous.fingerprint != self.fingerprint
+        self.counts = {'reused': 0, 'rescored': 0, 'new': 0}
+        self._chunks = []
+        self._type_changes = []
+
+    def score(self, ids, inputs):
+        """คำนวณ chunk เดียว: ids (N,) และ Input ตาม INPUT_NAMES -> array (N, O)"""
+        ids = _normalize_ids(ids)
+        inputs = _prepare_batch_inputs(inputs)
+        hashes = input_hashes(inputs)
+        idx = self.previous.lookup(ids)
+        known = idx >= 0
+
+        reuse = known & (not self.invalidated)
+        reuse[reuse] = self.previous.input_hash[idx[reuse]] == hashes[reuse]
+        allocations = np.empty((ids.shape[0], len(OUTPUT_NAMES)))
+        allocations[reuse] = self.previous.allocations[idx[reuse]]
+        changed = np.flatnonzero(~reuse)
+        if changed.size:
+            allocations[changed] = self.engine.calculate_portfolio_batch(
+                {name: values[changed] for name, values in inputs.items()})
+
+        self.counts['reused'] += int(np.count_nonzero(reuse))
+        self.counts['new'] += int(np.count_nonzero(~known))
+        self.counts['rescored'] += int(np.count_nonzero(known & ~reuse))
+
+        # ลูกค้าเดิมที่ประเภทพอร์ตเปลี่ยน
+        equity = OUTPUT_NAMES.index('equity')
+        before = classify_portfolio_types(self.previous.allocations[idx[known], equity])
+        after = classify_portfolio_types(allocations[known, equity])
+        flipped = before != after
+        if flipped.any():
+            self._type_changes.append((ids[known][flipped], before[flipped], after[flipped]))
+
+        self._chunks.append((ids, hashes, allocations))
+        return allocations
+
+    def type_changes(self):
+        """ลูกค้าที่ประเภทพอร์ตเปลี่ยนจากรอบก่อน: list ของ (รหัส, ประเภทเดิม, ประเภทใหม่) ตาม PORTFOLIO_TYPES"""
+        labels = [label for _, label in PORTFOLIO_TYPES]
+        return [(client, labels[old], labels[new])
+                for ids, before, after in self._type_changes
+                for client, old, new in zip(ids.tolist(), before.tolist(), after.tolist())]
+
+    def commit(self):
+        """บันทึก store ของรอบนี้ (เฉพาะลูกค้าในไฟล์รอบนี้) แทนของเดิม แล้วคืน store ใหม่"""
+        if self._chunks:
+            ids, hashes, allocations = (np.concatenate(parts) for parts in zip(*self._chunks))
+            # เรียงตามรหัส; รหัสซ้ำเก็บแถวสุดท้าย (index แรกของรหัสใน array ที่กลับด้าน)
+            _, first = np.unique(ids[::-1], return_index=True)
+            keep = ids.shape[0] - 1 - first
+            store = ScoreStore(ids[keep], hashes[keep], allocations[keep], self.fingerprint)
+        else:
+            store = ScoreStore.empty(self.fingerprint)
+        store.save(self.store_path)
+        return store
@@ -0,0 +1,117 @@
+# -----------------------------------------------------------------
+# PROJECT: Fuzzy Investment Advisor
+# FILE: parallel_scoring.py
+# AUTHOR: (Your Name) / Gemini AI
+# REQUIRES: pip install scikit-fuzzy
+# -----------------------------------------------------------------
+#
+# คำนวณสัดส่วนพอร์ตของ Input ชุดใหญ่ด้วยหลาย CPU core (ProcessPoolExecutor)
+# แต่ละ worker สร้าง/โหลด engine ครั้งเดียวตอนเริ่ม แล้วรับงานเป็น chunk ของ
+# array ตัวเลขล้วน (pickle ได้เร็ว) ผลลัพธ์ถูกนำมาต่อกันตามลำดับ Input เดิม
+# -----------------------------------------------------------------
+
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from fuzzy_investment_engine import INPUT_NAMES, FuzzyInvestmentEngine, _prepare_batch_inputs
+
+# จำนวนแถวสูงสุดต่องานที่ส่งให้ worker แต่ละครั้ง (Input ที่น้อยกว่า workers * ค่านี้
+# ถูกแบ่งเท่า ๆ กันให้ทุก worker)
+DEFAULT_WORKER_CHUNK_SIZE = 65536
+
+# ต่ำกว่าจำนวนแถวนี้คำนวณใน process ปัจจุบันเลย: pool เปิดค้างไว้ข้ามการเรียก ต้นทุนต่อการเรียก
+# จึงมีแค่การส่ง array ไป-กลับ (ไม่กี่ ms) ซึ่งคุ้มเมื่อ chunk ใหญ่ราว 10,000 แถวขึ้นไป
+MIN_PARALLEL_ROWS = 10000
+
+# engine ของ worker process (สร้างใน _init_worker ครั้งเดียวต่อ process)
+_worker_engine = None
+
+
+def available_cores():
+    """จำนวน CPU core ที่ process นี้ใช้ได้จริง (เคารพ CPU affinity ถ้ามี)"""
+    if hasattr(os, 'sched_getaffinity'):
+        return len(os.sched_getaffinity(0))
+    return os.cpu_count() or 1
+
+
+def _make_engine(artifact, defuzz):
+    # batch API ใช้ fused kernel อยู่แล้ว -> backend='fused' ไม่ต้อง import skfuzzy / สร้าง ControlSystem
+    return FuzzyInvestmentEngine(artifact=artifact, defuzz=defuzz, backend='fused')
+
+
+def _init_worker(artifact, defuzz):
+    global _worker_engine
+    _worker_engine = _make_engine(artifact, defuzz)
+
+
+def _score_chunk(block):
+    """งานของ worker: block คือ array (n, 4) เรียงคอลัมน์ตาม INPUT_NAMES"""
+    return _worker_engine.calculate_portfolio_batch(
+        {name: block[:, i] for i, name in enumerate(INPUT_NAMES)})
+
+
+class ParallelScorer:
+    """
+    ตัวคำนวณแบบหลาย process ที่ใช้แทน FuzzyInvestmentEngine ใน batch API ได้
+    (เช่นส่งให้ bulk_score.score_file) ใช้ร่วมกับ with-statement เพื่อปิด pool
+
+    workers:           จำนวน process (ค่าเริ่มต้น: จำนวน core ที่ใช้ได้)
+    artifact:          path ของไฟล์จาก save_artifact() ให้ worker โหลดแทนการสร้างใหม่
+    min_parallel_rows: Input ที่น้อยกว่านี้คำนวณแบบ serial ใน process ปัจจุบันเสมอ
+    """
+
+    def __init__(self, workers=None, artifact=None, defuzz='analytic',
+                 chunk_size=DEFAULT_WORKER_CHUNK_SIZE, min_parallel_rows=MIN_PARALLEL_ROWS):
+        self.workers = workers or available_cores()
+        self.artifact = artifact
+        self.defuzz = defuzz
+        self.chunk_size = chunk_size
+        self.min_parallel_rows = min_parallel_rows
+        self._local_engine = None
+        self._executor = None
+
+    def _serial_engine(self):
+        if self._local_engine is None:
+            self._local_engine = _make_engine(self.artifact, self.defuzz)
+        return self._local_engine
+
+    def calculate_portfolio_batch(self, user_age, user_income=None, user_time=None, user_risk=None):
+        """เหมือน FuzzyInvestmentEngine.calculate_portfolio_batch แต่กระจายงานไปหลาย process"""
+        inputs = _prepare_batch_inputs(user_age, user_income, user_time, user_risk)
+        n = inputs[INPUT_NAMES[0]].shape[0]
+        if self.workers <= 1 or n < self.min_parallel_rows:
+            return self._serial_engine().calculate_portfolio_batch(inputs)
+
+        if self._executor is None:
+            self._executor = ProcessPoolExecutor(
+                max_workers=self.workers,
+                initializer=_init_worker,
+                initargs=(self.artifact, self.defuzz),
+            )
+
+        block = np.column_stack([inputs[name] for name in INPUT_NAMES])
+        size = min(self.chunk_size, -(-n // self.workers))
+        chunks = [block[start:start + size] for start in range(0, n, size)]
+        # executor.map คืนผลตามลำดับของ chunks เสมอ
+        return np.concatenate(list(self._executor.map(_score_chunk, chunks)))
+
+    def close(self):
+        if self._executor is not None:
+            self._executor.shutdown()
+            self._executor = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def score_parallel(user_age, user_income=None, user_time=None, user_risk=None, workers=None,
+                   artifact=None, defuzz='analytic', chunk_size=DEFAULT_WORKER_CHUNK_SIZE,
+                   min_parallel_rows=MIN_PARALLEL_ROWS):
+    """คำนวณ Input ชุดเดียวด้วย ParallelScorer ชั่วคราว -> array (N, O)"""
+    with ParallelScorer(workers, artifact, defuzz, chunk_size, min_parallel_rows) as scorer:
+        return scorer.calculate_portfolio_batch(user_age, user_income, user_time, user_risk)
@@ -0,0 +1,122 @@
+# -----------------------------------------------------------------
+# PROJECT: Fuzzy Investment Advisor
+# FILE: robustness.py
+# AUTHOR: (Your Name) / Gemini AI
+# REQUIRES: pip install numpy
+# -----------------------------------------------------------------
+#
+# Monte Carlo robustness: Input ที่ลูกค้ารายงาน (เช่นระดับความเสี่ยง, ระยะเวลาลงทุน)
+# มีความคลาดเคลื่อน คำแนะนำที่อยู่ใกล้ขอบ membership หรือเกณฑ์ 40% / 70% ของหุ้น
+# อาจเปลี่ยนประเภทพอร์ตได้ง่าย โมดูลนี้สุ่ม Input รอบค่าที่รายงานมาหลายพันชุดต่อลูกค้า
+# คำนวณทั้งหมดด้วย batch API ในรอบเดียว แล้วสรุปเป็นค่าเฉลี่ย, percentile band
+# และความน่าจะเป็นของแต่ละประเภทพอร์ต (PORTFOLIO_TYPES)
+# -----------------------------------------------------------------
+
+import numpy as np
+
+from fuzzy_investment_engine import (
+    INPUT_NAMES,
+    OUTPUT_NAMES,
+    PORTFOLIO_TYPES,
+    _prepare_batch_inputs,
+    classify_portfolio_types,
+)
+
+# การกระจายของความคลาดเคลื่อนต่อ Input: (ชนิด, ขนาด)
+#   ('normal', sd)            ค่าที่รายงาน + N(0, sd)
+#   ('uniform', half_width)   ค่าที่รายงาน ± half_width (สม่ำเสมอ)
+#   ('triangular', half_width) ค่าที่รายงาน ± half_width (น้ำหนักมากที่ค่าที่รายงาน)
+# หรือ callable(rng, reported, n_samples) -> array (n_clients, n_samples)
+# Input ที่ไม่ระบุถือว่าไม่มีความคลาดเคลื่อน; ค่าที่สุ่มได้ถูก clip ให้อยู่ใน universe
+DEFAULT_NOISE = {
+    'risk_tolerance': ('normal', 1.0),
+    'time_horizon': ('normal', 2.0),
+}
+
+DEFAULT_SAMPLES = 2000
+DEFAULT_PERCENTILES = (5, 50, 95)
+
+# จำนวนแถว (ลูกค้า x sample) สูงสุดต่อรอบการคำนวณ (จำกัดหน่วยความจำชั่วคราว)
+MAX_ROWS_PER_PASS = 1 << 20
+
+
+def _perturb(rng, reported, noise, n_samples):
+    """สุ่ม Input รอบค่าที่รายงาน -> array (n_clients, n_samples)"""
+    if callable(noise):
+        return np.asarray(noise(rng, reported, n_samples), dtype=float)
+    kind, scale = noise
+    shape = (reported.shape[0], n_samples)
+    if kind == 'normal':
+        offsets = rng.normal(0., scale, shape)
+    elif kind == 'uniform':
+        offsets = rng.uniform(-scale, scale, shape)
+    elif kind == 'triangular':
+        offsets = rng.triangular(-scale, 0., scale, shape)
+    else:
+        raise ValueError(f"Unknown noise distribution '{kind}'; expected 'normal', 'uniform' or 'triangular'.")
+    return reported[:, None] + offsets
+
+
+def robustness_scores(engine, clients, noise=None, n_samples=DEFAULT_SAMPLES,
+                      percentiles=DEFAULT_PERCENTILES, seed=0):
+    """
+    ประเมินความทนทานของคำแนะนำต่อความคลาดเคลื่อนของ Input ทีละหลายลูกค้า
+
+    engine:  FuzzyInvestmentEngine (หรือ ParallelScorer) ที่มี calculate_portfolio_batch
+    clients: DataFrame / dict ของ array ตาม INPUT_NAMES (ค่าที่ลูกค้ารายงาน)
+    noise:   {ตัวแปร: การกระจาย} ตาม DEFAULT_NOISE (ค่าเริ่มต้น: DEFAULT_NOISE)
+    seed:    ผลลัพธ์ซ้ำเดิมเมื่อใช้ seed, n_samples และจำนวนลูกค้าเท่าเดิม
+
+    คืน dict ของ array:
+      'nominal'           (N, O) สัดส่วนพอร์ตจาก Input ที่รายงาน
+      'mean'              (N, O) ค่าเฉลี่ยของสัดส่วนพอร์ตจากทุก sample
+      'percentiles'       {p: (N, O)} percentile band ของสัดส่วนพอร์ต
+      'type_probability'  (N, len(PORTFOLIO_TYPES)) ความน่าจะเป็นของแต่ละประเภทพอร์ต
+      'nominal_type'      (N,) index ของประเภทพอร์ตจาก Input ที่รายงาน
+      'flip_probability'  (N,) ความน่าจะเป็นที่ประเภทพอร์ตต่างจาก nominal_type
+    """
+    noise = DEFAULT_NOISE if noise is None else noise
+    unknown = sorted(set(noise) - set(INPUT_NAMES))
+    if unknown:
+        raise ValueError(f"Unknown noise inputs {unknown}; expected names from {INPUT_NAMES}.")
+
+    reported = _prepare_batch_inputs(clients)
+    n = reported[INPUT_NAMES[0]].shape[0]
+    n_outputs, n_types = len(OUTPUT_NAMES), len(PORTFOLIO_TYPES)
+    equity = OUTPUT_NAMES.index('equity')
+    rng = np.random.default_rng(seed)
+
+    nominal = engine.calculate_portfolio_batch(reported)
+    results = {
+        'nominal': nominal,
+        'mean': np.empty((n, n_outputs)),
+        'percentiles': {p: np.empty((n, n_outputs)) for p in percentiles},
+        'type_probability': np.empty((n, n_types)),
+        'nominal_type': classify_portfolio_types(nominal[:, equity]),
+    }
+
+    # ลูกค้าหลายรายต่อรอบ: ทุก sample ของทุกลูกค้าในรอบถูกคำนวณใน batch เดียว
+    step = max(1, MAX_ROWS_PER_PASS // n_samples)
+    for start in range(0, n, step):
+        stop = min(start + step, n)
+        samples = {}
+        for name in INPUT_NAMES:
+            values = reported[name][start:stop]
+            if name in noise:
+                samples[name] = _perturb(rng, values, noise[name], n_samples).ravel()
+            else:
+                samples[name] = np.repeat(values, n_samples)
+
+        allocations = engine.calculate_portfolio_batch(samples).reshape(stop - start, n_samples, n_outputs)
+        results['mean'][start:stop] = allocations.mean(axis=1)
+        if percentiles:
+            bands = np.percentile(allocations, percentiles, axis=1)
+            for p, band in zip(percentiles, bands):
+                results['percentiles'][p][start:stop] = band
+
+        types = classify_portfolio_types(allocations[..., equity])
+        counts = (types[..., None] == np.arange(n_types)).sum(axis=1)
+        results['type_probability'][start:stop] = counts / n_samples
+
+    results['flip_probability'] = 1. - results['type_probability'][np.arange(n), results['nominal_type']]
+    return results
@@ -0,0 +1,299 @@
+# -----------------------------------------------------------------
+# PROJECT: Fuzzy Investment Advisor
+# FILE: scoring_server.py
+# AUTHOR: (Your Name) / Gemini AI
+# REQUIRES: pip install numpy (ใช้ asyncio ของ Python ไม่ต้องติดตั้ง web framework)
+# -----------------------------------------------------------------
+#
+# HTTP scoring service ภายในเครื่อง (asyncio) สำหรับระบบอื่นที่ต้องการคำแนะนำพอร์ต
+# request ที่เข้ามาพร้อมกันจะถูกรวมเป็น micro-batch (ตามขนาดหรือเวลารอสูงสุด)
+# แล้วคำนวณด้วย calculate_portfolio_batch ครั้งเดียว ก่อนตอบกลับทีละ request
+# คิวมีขนาดจำกัด: เมื่อคิวเต็มจะตอบ 503 ทันที (backpressure) แทนการรับงานค้างไม่จำกัด
+#
+#   POST /score   {"age": 30, "income": 60000, "time_horizon": 10, "risk_tolerance": 8}
+#   GET  /stats   ตัวนับ latency / throughput / ขนาด batch / คิว
+#
+# ตัวอย่าง:
+#   python scoring_server.py --port 8765 --max-batch-size 512 --max-wait-ms 2
+# -----------------------------------------------------------------
+
+import argparse
+import asyncio
+import collections
+import concurrent.futures
+import json
+import math
+import sys
+import time
+
+import numpy as np
+
+from fuzzy_investment_engine import INPUT_NAMES, FuzzyInvestmentEngine, get_example_recommendations
+
+DEFAULT_MAX_BATCH_SIZE = 256
+DEFAULT_MAX_WAIT_MS = 2.
+DEFAULT_MAX_QUEUE = 10000
+
+# จำนวน latency ล่าสุดที่เก็บไว้คำนวณ percentile
+LATENCY_WINDOW = 10000
+
+
+class QueueFullError(Exception):
+    """คิวของ MicroBatcher เต็ม (ผู้เรียกควรลองใหม่ภายหลัง)"""
+
+
+class MicroBatcher:
+    """
+    รวม request ที่เข้ามาพร้อมกันเป็น batch แล้วคำนวณด้วย engine ครั้งเดียว
+
+    max_batch_size: จำนวน request สูงสุดต่อ batch
+    max_wait_ms:    เวลารอสูงสุดหลัง request แรกของ batch ก่อนเริ่มคำนวณ
+    max_queue:      จำนวน request ที่รอคิวได้ (เกินนี้ submit จะ raise QueueFullError)
+    การคำนวณทำใน thread แยก event loop จึงรับ request ใหม่ได้ระหว่างคำนวณ batch ก่อนหน้า
+    """
+
+    def __init__(self, engine, max_batch_size=DEFAULT_MAX_BATCH_SIZE, max_wait_ms=DEFAULT_MAX_WAIT_MS,
+                 max_queue=DEFAULT_MAX_QUEUE):
+        self.engine = engine
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000.
+        self._queue = asyncio.Queue(maxsize=max_queue)
+        self._executor = concurrent.futures.ThreadPoolExecutor(max_workers=1)
+        self._task = None
+        self._started = time.perf_counter()
+        self._latencies = collections.deque(maxlen=LATENCY_WINDOW)
+        self._batch_sizes = collections.Counter()
+        self.completed = 0
+        self.rejected = 0
+        self.failed = 0
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def close(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        self._executor.shutdown()
+
+    async def submit(self, row):
+        """ส่ง Input หนึ่งชุด (tuple ตาม INPUT_NAMES) แล้วรอผลลัพธ์ (dict แบบ calculate_portfolio)"""
+        future = asyncio.get_running_loop().create_future()
+        try:
+            self._queue.put_nowait((row, future, time.perf_counter()))
+        except asyncio.QueueFull:
+            self.rejected += 1
+            raise QueueFullError("Scoring queue is full.") from None
+        return await future
+
+    async def _next_batch(self):
+        batch = [await self._queue.get()]
+        deadline = asyncio.get_running_loop().time() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            # ดึงที่รออยู่แล้วในคิวก่อน แล้วค่อยรอ request ใหม่จนหมดเวลา
+            try:
+                batch.append(self._queue.get_nowait())
+                continue
+            except asyncio.QueueEmpty:
+                pass
+            remaining = deadline - asyncio.get_running_loop().time()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self._queue.get(), remaining))
+            except asyncio.TimeoutError:
+                break
+        return batch
+
+    def _score(self, rows):
+        columns = np.array(rows, dtype=float).T
+        return self.engine.calculate_portfolio_batch(dict(zip(INPUT_NAMES, columns)))
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        output_names = self.engine.rulebase.output_names
+        while True:
+            batch = await self._next_batch()
+            self._batch_sizes[len(batch)] += 1
+            try:
+                values = await loop.run_in_executor(self._executor, self._score, [row for row, _, _ in batch])
+            except Exception as e:
+                self.failed += len(batch)
+                for _, future, _ in batch:
+                    if not future.done():
+                        future.set_exception(e)
+                continue
+
+            now = time.perf_counter()
+            for (_, future, submitted), row in zip(batch, values.tolist()):
+                self._latencies.append(now - submitted)
+                if not future.done():   # ผู้เรียกอาจยกเลิก (เช่น client ตัดการเชื่อมต่อ) ไปแล้ว
+                    future.set_result(dict(zip(output_names, row)))
+            self.completed += len(batch)
+
+    def stats(self):
+        """ตัวนับ latency (ตั้งแต่เข้าคิวจนได้ผล), throughput, ขนาด batch และคิว"""
+        elapsed = time.perf_counter() - self._started
+        batches = sum(self._batch_sizes.values())
+        stats = {
+            'completed': self.completed,
+            'rejected': self.rejected,
+            'failed': self.failed,
+            'queue_depth': self._queue.qsize(),
+            'queue_capacity': self._queue.maxsize,
+            'batches': batches,
+            'mean_batch_size': (sum(size * count for size, count in self._batch_sizes.items()) / batches
+                                if batches else 0.),
+            'max_batch_size_seen': max(self._batch_sizes, default=0),
+            'throughput_per_sec': self.completed / elapsed if elapsed > 0 else 0.,
+        }
+        if self._latencies:
+            p50, p95, p99 = np.percentile(np.array(self._latencies) * 1e3, [50, 95, 99])
+            stats.update(latency_p50_ms=p50, latency_p95_ms=p95, latency_p99_ms=p99)
+        return stats
+
+
+# --- HTTP/1.1 แบบเรียบง่าย (JSON เท่านั้น, รองรับ keep-alive) ---
+
+_REASONS = {200: 'OK', 400: 'Bad Request', 404: 'Not Found', 500: 'Internal Server Error',
+            503: 'Service Unavailable'}
+
+
+def _parse_score_request(body):
+    """แปลง body JSON เป็น tuple ตาม INPUT_NAMES (ValueError ถ้าข้อมูลไม่ครบ/ไม่ใช่ตัวเลขจำกัด)"""
+    try:
+        payload = json.loads(body or b'null')
+        row = tuple(float(payload[name]) for name in INPUT_NAMES)
+    except (KeyError, TypeError, ValueError, OverflowError) as e:
+        raise ValueError(f"Body must be a JSON object with numeric fields {list(INPUT_NAMES)} ({e!r}).")
+    # json / float() รับ NaN และ Infinity ได้ แต่ engine ปฏิเสธทั้ง batch (ValueError)
+    # จึงตรวจทีละ request ก่อนเข้าคิว ไม่ให้ request เดียวทำให้ request อื่นใน batch ล้มไปด้วย
+    invalid = [name for name, value in zip(INPUT_NAMES, row) if not math.isfinite(value)]
+    if invalid:
+        raise ValueError(f"Fields {invalid} must be finite numbers.")
+    return row
+
+
+async def _read_request(request_line, reader):
+    """อ่าน request หนึ่งอันต่อจาก request line -> (method, path, headers, body) (ValueError ถ้าผิดรูปแบบ)"""
+    method, path, _ = request_line.decode('latin-1').split(' ', 2)
+    headers = {}
+    while True:
+        line = await reader.readline()
+        if line in (b'\r\n', b'\n', b''):
+            break
+        name, _, value = line.decode('latin-1').partition(':')
+        headers[name.strip().lower()] = value.strip()
+    length = int(headers.get('content-length', 0))
+    if length < 0:
+        raise ValueError(f"Invalid Content-Length {length}")
+    body = await reader.readexactly(length)
+    return method, path, headers, body
+
+
+async def _respond(writer, status, payload, keep_alive):
+    data = json.dumps(payload, ensure_ascii=False).encode('utf-8')
+    writer.write(
+        f"HTTP/1.1 {status} {_REASONS[status]}\r\n"
+        f"Content-Type: application/json; charset=utf-8\r\n"
+        f"Content-Length: {len(data)}\r\n"
+        f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n".encode('latin-1') + data)
+    await writer.drain()
+
+
+class ScoringServer:
+    """HTTP server (asyncio) ที่ส่งทุก POST /score ผ่าน MicroBatcher"""
+
+    def __init__(self, batcher, host='127.0.0.1', port=8765):
+        self.batcher = batcher
+        self.host = host
+        self.port = port
+
+    async def serve_forever(self):
+        self.batcher.start()
+        server = await asyncio.start_server(self._handle_connection, self.host, self.port)
+        print(f"Scoring server listening on http://{self.host}:{self.port}", file=sys.stderr)
+        try:
+            async with server:
+                await server.serve_forever()
+        finally:
+            await self.batcher.close()
+
+    async def _handle_connection(self, reader, writer):
+        try:
+            while True:
+                try:
+                    # readline() แจ้ง ValueError เมื่อบรรทัดยาวเกิน limit ของ StreamReader
+                    request_line = await reader.readline()
+                    if not request_line:
+                        break
+                    method, path, headers, body = await _read_request(request_line, reader)
+                except ValueError as e:
+                    # ไม่รู้ว่า request ถัดไปเริ่มตรงไหน -> ตอบ 400 แล้วปิดการเชื่อมต่อ
+                    await _respond(writer, 400, {'error': f"Malformed request: {e}"}, keep_alive=False)
+                    break
+
+                status, payload = await self._route(method, path, body)
+                keep_alive = headers.get('connection', '').lower() != 'close'
+                await _respond(writer, status, payload, keep_alive)
+                if not keep_alive:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    async def _route(self, method, path, body):
+        if method == 'GET' and path == '/stats':
+            return 200, self.batcher.stats()
+        if method != 'POST' or path != '/score':
+            return 404, {'error': f"Unknown endpoint {method} {path}"}
+        try:
+            row = _parse_score_request(body)
+        except ValueError as e:
+            return 400, {'error': str(e)}
+        try:
+            allocation = await self.batcher.submit(row)
+        except QueueFullError as e:
+            return 503, {'error': str(e)}
+        except Exception as e:
+            # batch ทั้งก้อนล้ม (MicroBatcher นับไว้ใน failed) -> ตอบ 500 แทนการตัดการเชื่อมต่อ
+            return 500, {'error': f"Scoring failed: {e!r}"}
+        recommendations = get_example_recommendations(allocation['equity'], allocation['bonds'],
+                                                      allocation['cash'])
+        return 200, {'allocation': allocation, 'recommendations': recommendations}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Serve Fuzzy Investment Engine recommendations over HTTP.")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--max-batch-size', type=int, default=DEFAULT_MAX_BATCH_SIZE,
+                        help=f"requests per micro-batch (default: {DEFAULT_MAX_BATCH_SIZE})")
+    parser.add_argument('--max-wait-ms', type=float, default=DEFAULT_MAX_WAIT_MS,
+                        help=f"max time to hold a batch open for more requests (default: {DEFAULT_MAX_WAIT_MS})")
+    parser.add_argument('--max-queue', type=int, default=DEFAULT_MAX_QUEUE,
+                        help=f"queued requests before answering 503 (default: {DEFAULT_MAX_QUEUE})")
+    parser.add_argument('--artifact', help="compiled engine artifact from save_artifact() to load")
+    args = parser.parse_args(argv)
+
+    async def serve():
+        # สร้าง MicroBatcher ภายใน event loop (asyncio.Queue ผูกกับ loop ที่ใช้งาน)
+        engine = FuzzyInvestmentEngine(artifact=args.artifact, backend='fused')
+        batcher = MicroBatcher(engine, args.max_batch_size, args.max_wait_ms, args.max_queue)
+        await ScoringServer(batcher, args.host, args.port).serve_forever()
+
+    try:
+        asyncio.run(serve())
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())